@@ -0,0 +1,376 @@
+# Title:       Project 2 - File Recovery Benchmark
+# Description: Generates reproducible synthetic disk images with known files planted in them, runs FileRecovery.py on
+#              them, and records how fast it scans, how much memory it uses, how long extraction takes, and how many of
+#              the planted files it recovers correctly, so runs can be compared over time
+# Authors:     Adia Foster (azf0046), Mary Mitchell (mem0250), and Vicki McLendon (vlm0013)
+# Course:      COMP5350 - Digital Forensics
+# Run:         python3 Benchmark.py (A 256 MiB image with random filler)
+#              python3 Benchmark.py --size 20480 --filler zero (A 20 GiB image with zeroed free space)
+#              python3 Benchmark.py --seed 7 --max-file-size 4096 --decoys 4 (Other files, larger files, more decoys)
+#              python3 Benchmark.py --recovery-args "--jobs 8 --scan-mode chunked" (Benchmark other FileRecovery.py options)
+# Sources:     https://docs.python.org/3/library/random.html#random.Random.randbytes
+#              https://docs.python.org/3/library/os.html#os.wait4
+#              https://docs.python.org/3/library/resource.html#resource.getrusage
+
+import argparse
+import datetime
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shlex
+import struct
+import subprocess
+import sys
+import time
+import zipfile
+import zlib
+
+# GLOBAL VARIABLES
+
+# FileRecovery.py is run from the same directory as this script
+RECOVERY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FileRecovery.py')
+
+# Every type of file FileRecovery.py looks for (the names it uses for their signatures)
+PLANTED_TYPES = ['MPG', 'PDF', 'BMP', 'GIF87a', 'GIF89a', 'JPG', 'DOCX', 'AVI', 'PNG']
+
+# Headers that are planted in the free space in the middle of a sector, where FileRecovery.py has to ignore them
+UNALIGNED_DECOYS = [bytes.fromhex('000001b3'), bytes.fromhex('25504446'), bytes.fromhex('424d'), bytes.fromhex('474946383761'),
+    bytes.fromhex('474946383961'), bytes.fromhex('ffd8ff'), bytes.fromhex('504b030414000600'), bytes.fromhex('52494646'),
+    bytes.fromhex('89504e470d0a1a0a')]
+
+# Headers that are planted at the start of a sector but fail the checks FileRecovery.py makes on them (a BMP with
+# reserved bytes that are not zero, and a RIFF file that is a WAVE instead of an AVI)
+ALIGNED_DECOYS = [b'BM' + struct.pack('<I', 4096) + b'\x01\x02\x03\x04', b'RIFF' + struct.pack('<I', 4096) + b'WAVEfmt ']
+
+# Size of each piece of filler written to the image at a time (1 MiB)
+WRITE_SIZE = 1024 * 1024
+
+# Size of the window FileRecovery.py's structural carvers search for an end marker in at a time (1 MiB)
+STRUCTURE_BUFFER_SIZE = 1024 * 1024
+
+# End marker of each type planted as a boundary case, and how far into the file the carver starts searching for it
+BOUNDARY_MARKERS = {'PDF': (b'%%EOF', 0), 'JPG': (b'\xff\xd9', 30)}
+
+# Bump this when the way images are generated changes, so images made the old way are generated again
+GENERATOR_VERSION = 2
+
+# PLANTED FILES
+
+# Notes for planted files: each generator makes a small but structurally valid file of the given type around a payload of
+#                          about the given size, without any of the bytes that would end the file early
+
+# makeMpg: an MPEG sequence header, data with no start codes in it, and a sequence end code
+def makeMpg(rng, payloadSize):
+    return bytes.fromhex('000001b3') + rng.randbytes(payloadSize).replace(b'\x00', b'\x01') + bytes.fromhex('000001b7')
+
+# makePdf: a PDF with one stream object, a cross reference table, and a startxref that points at it
+def makePdf(rng, payloadSize):
+    stream = rng.randbytes(payloadSize // 2).hex().encode()
+    body = b'%PDF-1.4\n1 0 obj\n<< /Length ' + str(len(stream)).encode() + b' >>\nstream\n' + stream + b'\nendstream\nendobj\n'
+    xref = b'xref\n0 2\n0000000000 65535 f \n' + ('%010d 00000 n \n' % 9).encode()
+    return body + xref + b'trailer\n<< /Size 2 >>\nstartxref\n' + str(len(body)).encode() + b'\n%%EOF\n'
+
+# makeBmp: a bitmap file header with the file size and zeroed reserved bytes, followed by the rest of the file
+def makeBmp(rng, payloadSize):
+    return b'BM' + struct.pack('<I', 54 + payloadSize) + bytes(4) + struct.pack('<I', 54) + rng.randbytes(40 + payloadSize)
+
+# makeGif: a GIF with one image whose data is split into sub-blocks of at most 255 bytes, followed by the trailer
+def makeGif(rng, payloadSize, version):
+    data = rng.randbytes(payloadSize)
+    subBlocks = b''.join(bytes([len(data[i:i + 255])]) + data[i:i + 255] for i in range(0, len(data), 255))
+    return (b'GIF' + version + struct.pack('<HH', 16, 16) + bytes(3) + b'\x2c' + struct.pack('<HHHH', 0, 0, 16, 16) + b'\x00' +
+        b'\x08' + subBlocks + b'\x00\x3b')
+
+# makeJpg: a JFIF header, a start of scan, entropy coded data with no markers in it, and an end of image marker
+def makeJpg(rng, payloadSize):
+    return (bytes.fromhex('ffd8ffe0') + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00' + b'\xff\xda' +
+        struct.pack('>H', 8) + b'\x01\x01\x00\x00\x3f\x00' + rng.randbytes(payloadSize).replace(b'\xff', b'\xfe') + b'\xff\xd9')
+
+# makeDocx: a zip file holding the parts of a Word document (with the version bytes Word writes in the first header)
+def makeDocx(rng, payloadSize):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as docx:
+        docx.writestr('[Content_Types].xml', '<?xml version="1.0"?><Types/>')
+        docx.writestr('word/media/image1.bin', rng.randbytes(payloadSize))
+    data = bytearray(buffer.getvalue())
+    data[4:8] = bytes.fromhex('14000600')
+    return bytes(data)
+
+# makeAvi: a RIFF header with the size of the rest of the file, the AVI form type, and the first list
+def makeAvi(rng, payloadSize):
+    body = b'AVI LIST' + rng.randbytes(payloadSize)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+# makePng: the PNG signature and IHDR, IDAT and IEND chunks with correct lengths and CRCs
+def makePng(rng, payloadSize):
+    def chunk(chunkType, data):
+        return struct.pack('>I', len(data)) + chunkType + data + struct.pack('>I', zlib.crc32(chunkType + data))
+    return (bytes.fromhex('89504e470d0a1a0a') + chunk(b'IHDR', struct.pack('>IIBBBBB', 16, 16, 8, 2, 0, 0, 0)) +
+        chunk(b'IDAT', rng.randbytes(payloadSize)) + chunk(b'IEND', b''))
+
+# makePlantedFile: makes a file of the given type
+def makePlantedFile(rng, fileType, payloadSize):
+    if fileType == 'MPG':
+        return makeMpg(rng, payloadSize)
+    elif fileType == 'PDF':
+        return makePdf(rng, payloadSize)
+    elif fileType == 'BMP':
+        return makeBmp(rng, payloadSize)
+    elif fileType == 'GIF87a':
+        return makeGif(rng, payloadSize, b'87a')
+    elif fileType == 'GIF89a':
+        return makeGif(rng, payloadSize, b'89a')
+    elif fileType == 'JPG':
+        return makeJpg(rng, payloadSize)
+    elif fileType == 'DOCX':
+        return makeDocx(rng, payloadSize)
+    elif fileType == 'AVI':
+        return makeAvi(rng, payloadSize)
+    elif fileType == 'PNG':
+        return makePng(rng, payloadSize)
+
+# IMAGE GENERATION
+
+# writeFiller: writes length bytes of free space to the image, with unaligned (and sometimes aligned) decoys in it
+def writeFiller(rng, imageFile, length, filler, decoys):
+    # Write all but the last piece of the gap straight to the image
+    while length > WRITE_SIZE:
+        imageFile.write(rng.randbytes(WRITE_SIZE) if filler == 'random' else bytes(WRITE_SIZE))
+        length = length - WRITE_SIZE
+    position = imageFile.tell()
+    gap = bytearray(rng.randbytes(length) if filler == 'random' else bytes(length))
+
+    # Decoys go in the last piece of the gap
+    numDecoys = 0
+    for _ in range(decoys):
+        if rng.random() < 0.25:
+            decoy = rng.choice(ALIGNED_DECOYS)
+            sectorStart = (position + 511) // 512 * 512 - position
+            offsets = range(sectorStart, len(gap) - len(decoy), 512)
+        else:
+            decoy = rng.choice(UNALIGNED_DECOYS)
+            offsets = [offset for offset in range(1, len(gap) - len(decoy), 97) if (position + offset) % 512 != 0]
+        if offsets:
+            offset = rng.choice(offsets)
+            gap[offset:offset + len(decoy)] = decoy
+            numDecoys = numDecoys + 1
+    imageFile.write(gap)
+    return numDecoys
+
+# makeBoundaryFile: makes a file of the given type whose end marker straddles the end of the first window the carver
+#                   searches for it in (the payload size is adjusted until the marker lands there)
+def makeBoundaryFile(rng, fileType):
+    marker, searchStart = BOUNDARY_MARKERS[fileType]
+    payloadSize = STRUCTURE_BUFFER_SIZE
+    while True:
+        state = rng.getstate()
+        data = makePlantedFile(rng, fileType, payloadSize)
+        offset = data.rfind(marker) - searchStart
+        if STRUCTURE_BUFFER_SIZE - len(marker) < offset < STRUCTURE_BUFFER_SIZE:
+            return data
+        rng.setstate(state)
+        payloadSize = payloadSize + STRUCTURE_BUFFER_SIZE - 1 - offset
+
+# generateImage: writes a disk image of the given size with files of every type planted at the start of sectors
+#                between gaps of filler, and returns the ground truth for it
+def generateImage(imagePath, size, seed, filler, numFiles, maxFileSize, decoys):
+    rng = random.Random(seed)
+    truth = {'generatorVersion': GENERATOR_VERSION, 'size': size, 'seed': seed, 'filler': filler, 'numFiles': numFiles,
+        'maxFileSize': maxFileSize, 'decoys': decoys, 'files': [], 'numDecoys': 0}
+    # Leave room so the gaps between files average out to fill the image
+    averageGap = max(512, (size - numFiles * maxFileSize // 2) // (numFiles + 1)) // 512 * 512
+
+    with open(imagePath, 'wb') as imageFile:
+        for fileNumber in range(numFiles):
+            fileType = PLANTED_TYPES[fileNumber % len(PLANTED_TYPES)]
+            # The first file of each type with an end marker is planted so the marker straddles a search window, as long
+            # as the image has room for it
+            if fileNumber < len(PLANTED_TYPES) and fileType in BOUNDARY_MARKERS and size >= 16 * STRUCTURE_BUFFER_SIZE:
+                data = makeBoundaryFile(rng, fileType)
+            else:
+                data = makePlantedFile(rng, fileType, rng.randint(64, maxFileSize))
+            gap = rng.randint(1, 2 * averageGap // 512) * 512
+            # Stop planting files once the image is full
+            if imageFile.tell() + gap + len(data) > size:
+                break
+            truth['numDecoys'] = truth['numDecoys'] + writeFiller(rng, imageFile, gap - imageFile.tell() % 512, filler, decoys)
+            start = imageFile.tell()
+            imageFile.write(data)
+            truth['files'].append({'type': fileType, 'startOffset': start, 'endOffset': start + len(data),
+                'sha256': hashlib.sha256(data).hexdigest()})
+
+        # Fill the rest of the image
+        truth['numDecoys'] = truth['numDecoys'] + writeFiller(rng, imageFile, size - imageFile.tell(), filler, 0)
+    return truth
+
+# loadOrGenerateImage: reuses an image made earlier with the same settings (its ground truth is saved next to it), or
+#                      generates it
+def loadOrGenerateImage(workDirectory, size, seed, filler, numFiles, maxFileSize, decoys):
+    name = 'bench-' + str(size // (1024 * 1024)) + 'M-' + filler + '-s' + str(seed) + '-n' + str(numFiles) + '-f' + str(maxFileSize) + '-d' + str(decoys)
+    imagePath = os.path.join(workDirectory, name + '.dd')
+    truthPath = os.path.join(workDirectory, name + '.truth.json')
+    if os.path.exists(imagePath) and os.path.exists(truthPath):
+        with open(truthPath) as truthFile:
+            truth = json.load(truthFile)
+        if truth.get('generatorVersion') == GENERATOR_VERSION and os.path.getsize(imagePath) == size:
+            print('Reusing disk image ' + imagePath + '...')
+            return imagePath, truth
+
+    print('Generating disk image ' + imagePath + '...')
+    startTime = time.perf_counter()
+    truth = generateImage(imagePath, size, seed, filler, numFiles, maxFileSize, decoys)
+    with open(truthPath, 'w') as truthFile:
+        json.dump(truth, truthFile)
+    print('Disk image generated in ' + str(round(time.perf_counter() - startTime, 2)) + ' seconds (' +
+        str(len(truth['files'])) + ' files, ' + str(truth['numDecoys']) + ' decoys)...')
+    return imagePath, truth
+
+# MEASUREMENT
+
+# runRecovery: runs FileRecovery.py with the given arguments and returns its wall time (in seconds) and peak resident
+#              memory (in KiB), measured for that one process
+def runRecovery(arguments, workDirectory):
+    startTime = time.perf_counter()
+    with open(os.path.join(workDirectory, 'recovery.log'), 'ab') as logFile:
+        process = subprocess.Popen([sys.executable, RECOVERY_SCRIPT] + arguments, cwd = workDirectory, stdout = logFile,
+            stderr = subprocess.STDOUT)
+        pid, status, usage = os.wait4(process.pid, 0)
+    wallTime = time.perf_counter() - startTime
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise SystemExit('FileRecovery.py ' + ' '.join(arguments) + ' failed, see ' + os.path.join(workDirectory, 'recovery.log'))
+    return wallTime, usage.ru_maxrss
+
+# readRecords: reads the JSON lines manifest FileRecovery.py wrote
+def readRecords(manifestPath):
+    with open(manifestPath) as manifestFile:
+        return [json.loads(line) for line in manifestFile if line.strip()]
+
+# scoreRecords: compares the files FileRecovery.py found (and the hashes of what it extracted) to the ground truth
+def scoreRecords(truth, scanRecords, extractRecords):
+    expected = {(plantedFile['type'], plantedFile['startOffset'], plantedFile['endOffset']): plantedFile['sha256']
+        for plantedFile in truth['files']}
+    found = {(record['type'], record['startOffset'], record['endOffset']) for record in scanRecords}
+    truePositives = found & set(expected)
+    intact = sum(1 for record in extractRecords
+        if expected.get((record['type'], record['startOffset'], record['endOffset'])) == record.get('sha256'))
+
+    # Count how each type did so a format that is missed or over-reported stands out
+    perType = {}
+    for fileType in PLANTED_TYPES:
+        perType[fileType] = {'planted': sum(1 for key in expected if key[0] == fileType),
+            'found': sum(1 for key in found if key[0] == fileType),
+            'correct': sum(1 for key in truePositives if key[0] == fileType)}
+
+    return {'planted': len(expected), 'found': len(found), 'correct': len(truePositives),
+        'falsePositives': len(found - set(expected)), 'missed': len(set(expected) - found), 'intact': intact,
+        'precision': round(len(truePositives) / len(found), 4) if found else 1.0,
+        'recall': round(len(truePositives) / len(expected), 4) if expected else 1.0, 'perType': perType}
+
+# getRevision: returns the git commit the benchmark is being run on, if there is one
+def getRevision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = os.path.dirname(RECOVERY_SCRIPT),
+            capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# printComparison: prints how this run compares to the last saved run on the same image with the same options
+def printComparison(resultsPath, result):
+    previous = None
+    if os.path.exists(resultsPath):
+        with open(resultsPath) as resultsFile:
+            for line in resultsFile:
+                if not line.strip():
+                    continue
+                earlier = json.loads(line)
+                if earlier['image'] == result['image'] and earlier['recoveryArgs'] == result['recoveryArgs']:
+                    previous = earlier
+    if previous is None:
+        print('No earlier run on this image to compare with')
+        return
+    print('Compared with the run on ' + previous['timestamp'] + ' (revision ' + str(previous['revision']) + '):')
+    for name in ('scanMiBPerSecond', 'scanPeakRssMiB', 'extractSeconds', 'recall', 'precision'):
+        print('    ' + name + ': ' + str(previous[name]) + ' -> ' + str(result[name]))
+
+# MAIN METHOD
+
+# parseArguments: reads the image settings and benchmark options from the command line
+def parseArguments():
+    parser = argparse.ArgumentParser(description = 'Benchmark FileRecovery.py on generated disk images with known contents.')
+    parser.add_argument('--size', type = int, default = 256, help = 'size of the generated disk image in MiB (default: %(default)s)')
+    parser.add_argument('--seed', type = int, default = 1, help = 'seed the disk image is generated from (default: %(default)s)')
+    parser.add_argument('--filler', choices = ['random', 'zero'], default = 'random',
+        help = 'what the free space between files is filled with (default: %(default)s)')
+    parser.add_argument('--files', dest = 'numFiles', type = int, default = None,
+        help = 'number of files to plant (default: one for every MiB of the image, at least one of each type)')
+    parser.add_argument('--max-file-size', dest = 'maxFileSize', type = int, default = 256,
+        help = 'largest payload of a planted file in KiB (default: %(default)s)')
+    parser.add_argument('--decoys', type = int, default = 2,
+        help = 'number of decoy headers planted in each gap between files (default: %(default)s)')
+    parser.add_argument('--work-dir', dest = 'workDirectory', default = 'benchmark',
+        help = 'directory the images and recovered files are kept in (default: %(default)s)')
+    parser.add_argument('--results', dest = 'resultsPath', default = 'BenchmarkResults.jsonl',
+        help = 'file each run\'s results are added to (default: %(default)s)')
+    parser.add_argument('--recovery-args', dest = 'recoveryArgs', default = '',
+        help = 'more arguments to pass to FileRecovery.py, for example "--jobs 8"')
+    arguments = parser.parse_args()
+    if arguments.numFiles is None:
+        arguments.numFiles = max(len(PLANTED_TYPES), arguments.size)
+    return arguments
+
+def main():
+    print('=================== STARTING FILE RECOVERY BENCHMARK ===================')
+    arguments = parseArguments()
+    os.makedirs(arguments.workDirectory, exist_ok = True)
+    imagePath, truth = loadOrGenerateImage(arguments.workDirectory, arguments.size * 1024 * 1024, arguments.seed,
+        arguments.filler, arguments.numFiles, arguments.maxFileSize * 1024, arguments.decoys)
+    imagePath = os.path.abspath(imagePath)
+    recoveryArgs = shlex.split(arguments.recoveryArgs)
+
+    # Scan only: list the files without recovering or hashing them
+    print('Scanning the disk image...')
+    scanManifest = os.path.abspath(os.path.join(arguments.workDirectory, 'scan.jsonl'))
+    scanSeconds, scanPeakRss = runRecovery(recoveryArgs + ['--no-scan-index', '--list-only', '--manifest', scanManifest,
+        imagePath], arguments.workDirectory)
+    scanRecords = readRecords(scanManifest)
+
+    # Extraction: recover and hash the files the scan found
+    print('Extracting the files found...')
+    outputDirectory = os.path.abspath(os.path.join(arguments.workDirectory, 'Recovered'))
+    extractManifest = os.path.abspath(os.path.join(arguments.workDirectory, 'extract.jsonl'))
+    extractSeconds, extractPeakRss = runRecovery(recoveryArgs + ['--extract', scanManifest, '--output', outputDirectory,
+        '--hashes', 'sha256', '--manifest', extractManifest, imagePath], arguments.workDirectory)
+    extractRecords = readRecords(extractManifest)
+
+    accuracy = scoreRecords(truth, scanRecords, extractRecords)
+    imageMiB = truth['size'] / (1024 * 1024)
+    result = {'timestamp': datetime.datetime.now().isoformat(timespec = 'seconds'), 'revision': getRevision(),
+        'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+        'image': os.path.basename(imagePath), 'imageMiB': imageMiB, 'recoveryArgs': arguments.recoveryArgs,
+        'scanSeconds': round(scanSeconds, 3), 'scanMiBPerSecond': round(imageMiB / scanSeconds, 2),
+        'scanPeakRssMiB': round(scanPeakRss / 1024, 1), 'extractSeconds': round(extractSeconds, 3),
+        'extractPeakRssMiB': round(extractPeakRss / 1024, 1),
+        'extractedMiB': round(sum(record['size'] for record in extractRecords) / (1024 * 1024), 2)}
+    result.update(accuracy)
+
+    print('\nScan: ' + str(result['scanMiBPerSecond']) + ' MiB/s (' + str(result['scanSeconds']) + ' seconds, peak memory ' +
+        str(result['scanPeakRssMiB']) + ' MiB)')
+    print('Extraction: ' + str(result['extractSeconds']) + ' seconds for ' + str(result['extractedMiB']) + ' MiB')
+    print('Accuracy: ' + str(result['correct']) + ' of ' + str(result['planted']) + ' planted files found (' +
+        str(result['intact']) + ' intact), ' + str(result['falsePositives']) + ' false positives')
+    for fileType, counts in accuracy['perType'].items():
+        print('    ' + fileType + ': ' + str(counts['correct']) + ' of ' + str(counts['planted']) + ' found, ' +
+            str(counts['found'] - counts['correct']) + ' false positives')
+    printComparison(arguments.resultsPath, result)
+
+    # Save the results so later runs can be compared with this one
+    with open(arguments.resultsPath, 'a') as resultsFile:
+        resultsFile.write(json.dumps(result) + '\n')
+    print('Results added to ' + arguments.resultsPath)
+
+if __name__ == "__main__":
+    main()
@@ -1,426 +1,3240 @@
 # Title:       Project 2 - Automated File Recovery
-# Description: Takes a disk image, locates file signatures, properly recovers user generated 
-#              files without corruption, and generates a SHA-256 hash for each recovered file
+# Description: Takes a disk image, locates file signatures, properly recovers user generated
+#              files without corruption, and generates SHA-256, SHA-1, and MD5 hashes for each recovered file
 # Authors:     Adia Foster (azf0046), Mary Mitchell (mem0250), and Vicki McLendon (vlm0013)
 # Course:      COMP5350 - Digital Forensics
 # Due Date:    5 November 2022
 # Run:         python3 FileRecovery.py Project2.dd (Where Project2.dd can be any disk image)
+#              python3 FileRecovery.py --scan-mode chunked --chunk-size 64 Project2.dd (Bounded memory scan)
+#              python3 FileRecovery.py --sector-index --sector-size 4096 Project2.dd (Only look for headers at sector starts)
+#              python3 FileRecovery.py --sink zip --output Recovered.zip Project2.dd (Write the recovered files to a zip file)
+#              python3 FileRecovery.py --hashes sha256 --hash-workers 8 Project2.dd (Choose the hashes and hashing threads)
+#              python3 FileRecovery.py --jobs 32 Project2.dd (Scan the disk image on 32 cores)
+#              python3 FileRecovery.py --max-size JPG=16 --max-size AVI=8192 Project2.dd (Limit file sizes in MiB)
+#              python3 FileRecovery.py --types JPG,PNG Project2.dd (Only recover some types, reusing the saved scan index)
+#              python3 FileRecovery.py --list-only --manifest hits.csv Project2.dd (List what is on the disk, recover nothing)
+#              python3 FileRecovery.py --extract selected.csv Project2.dd (Recover only the files listed in a manifest)
+#              python3 FileRecovery.py --profile profile.json Project2.dd (Save the timings and signature counts to a file)
+#              python3 FileRecovery.py Evidence.001 (Read split raw segments Evidence.001, Evidence.002, ... as one image)
+#              python3 FileRecovery.py --cache-size 256 Project2.dd.gz (Read a gzip or zstd compressed image in place)
+#              python3 FileRecovery.py --unallocated only Project2.dd (Only carve the space FAT/NTFS file systems are not using)
+#              python3 FileRecovery.py --dedup link --known-hashes NSRLFile.txt Project2.dd (Write each file only once and
+#              leave out known files)
+#              python3 -c "import FileRecovery; print(list(FileRecovery.carveDiskImage('Project2.dd')))" (Use it as a library)
+#              python3 FileRecovery.py --output Cases --batch-jobs 8 --memory-limit 16384 Evidence/ (Recover every image in
+#              a directory, 8 at a time in at most 16 GiB of memory, each into its own directory under Cases)
 # Sources:     https://stackoverflow.com/questions/34687516/how-to-read-binary-files-as-hex-in-python
 #              https://stackoverflow.com/questions/3730964/python-script-execute-commands-in-terminal
-
-import math
+#              https://docs.python.org/3/library/mmap.html
+#              https://numpy.org/doc/stable/reference/generated/numpy.frombuffer.html
+#              https://docs.python.org/3/library/os.html#os.copy_file_range
+#              https://www.w3.org/TR/png/#5Chunk-layout
+#              https://www.w3.org/Graphics/JPEG/itu-t81.pdf (Annex B, Compressed data formats)
+#              https://www.w3.org/Graphics/GIF/spec-gif89a.txt
+#              https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT
+#              https://opensource.adobe.com/dc-acrobat-sdk-docs/pdfstandards/PDF32000_2008.pdf (7.5, File Structure)
+#              https://github.com/madler/zlib/blob/master/examples/zran.c (Random access to compressed data)
+#              https://python-zstandard.readthedocs.io/en/latest/decompressor.html
+#              https://uefi.org/specs/UEFI/2.10/05_GUID_Partition_Table_Format.html
+#              https://academy.cba.mit.edu/classes/networking_communications/SD/FAT.pdf (Microsoft FAT specification)
+#              https://flatcap.github.io/linux-ntfs/ntfs/ (NTFS documentation, $Bitmap and data runs)
+#              https://man7.org/linux/man-pages/man2/lseek.2.html (SEEK_DATA and SEEK_HOLE)
+#              https://docs.python.org/3/library/concurrent.futures.html#concurrent.futures.wait
+#              https://www.nist.gov/itl/ssd/software-quality-group/national-software-reference-library-nsrl
+#              https://docs.python.org/3/reference/datamodel.html#slots
+#              https://docs.python.org/3/library/asyncio-task.html#asyncio.run_coroutine_threadsafe
+
+import argparse
+import array
+import asyncio
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import errno
+import gzip
+import hashlib
+import itertools
+import json
+import mmap
+import multiprocessing
 import os
+import re
 import sys
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+
+# NumPy is optional, without it the sector index is built by checking one sector at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# zstandard is optional, it is only needed to read zstd compressed disk images
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # GLOBAL VARIABLES
 
-# Notes for signatures: AVI is the first 8 hex characters of the signature, which is generally
+# Notes for signatures: AVI is the first 4 bytes of the signature, which is generally
 #                       followed by the file size and then the rest of the signature comes after that
-signatures = {'MPG': '000001b3', 'PDF': '25504446', 'BMP': '424d', 'GIF87a': '474946383761',
-    'GIF89a': '474946383961', 'JPG': 'ffd8ff', 'DOCX': '504b030414000600', 'AVI': '52494646',
-    'PNG': '89504e470d0a1a0a' }
+signatures = {'MPG': bytes.fromhex('000001b3'), 'PDF': bytes.fromhex('25504446'), 'BMP': bytes.fromhex('424d'),
+    'GIF87a': bytes.fromhex('474946383761'), 'GIF89a': bytes.fromhex('474946383961'), 'JPG': bytes.fromhex('ffd8ff'),
+    'DOCX': bytes.fromhex('504b030414000600'), 'AVI': bytes.fromhex('52494646'), 'PNG': bytes.fromhex('89504e470d0a1a0a') }
 
-# Notes for trailers/footers: for some of the shorter trailers/footers, we added trailing zeros to make sure that 
+# Notes for trailers/footers: for some of the shorter trailers/footers, we added trailing zeros to make sure that
 #                             the actual end of the file is found and not false positives (especially for pdfs which
 #                             can have multiple eofs)
-trailers = {'MPG1': '000001b7', 'MPG2': '000001b9', 'PDF1': '0d2525454f460d000000', 'PDF2': '0d0a2525454f460d0a000000',
-    'PDF3': '0a2525454f460a000000', 'PDF4': '0a2525454f46000000', 'GIF': '003b000000', 'JPG': 'ffd9000000',
-    'DOCX': '504b0506', 'PNG': '49454e44ae426082'}
+trailers = {'MPG1': bytes.fromhex('000001b7'), 'MPG2': bytes.fromhex('000001b9'), 'PDF1': bytes.fromhex('0d2525454f460d000000'),
+    'PDF2': bytes.fromhex('0d0a2525454f460d0a000000'), 'PDF3': bytes.fromhex('0a2525454f460a000000'),
+    'PDF4': bytes.fromhex('0a2525454f46000000'), 'GIF': bytes.fromhex('003b000000'), 'JPG': bytes.fromhex('ffd9000000'),
+    'DOCX': bytes.fromhex('504b0506'), 'PNG': bytes.fromhex('49454e44ae426082')}
 
-# SUPPORTING METHODS
+# Largest file of each type that will be carved (in bytes), so a damaged file only costs a bounded read
+# (these can be changed with --max-size TYPE=MiB)
+MAX_FILE_SIZES = {'MPG': 1024 * 1024 * 1024, 'PDF': 256 * 1024 * 1024, 'BMP': 256 * 1024 * 1024, 'GIF87a': 64 * 1024 * 1024,
+    'GIF89a': 64 * 1024 * 1024, 'JPG': 64 * 1024 * 1024, 'DOCX': 256 * 1024 * 1024, 'AVI': 4 * 1024 * 1024 * 1024,
+    'PNG': 128 * 1024 * 1024}
 
-# openDiskImage: opens the disk image, gets the contents of it, and converts them to hexadecimal
-def openDiskImage(inputDisk):
-    print('Opening disk image...')
+# Files only start at the beginning of a sector, so any signature found elsewhere is just part of another file's contents
+# (this is the default, disks with 4096-byte sectors can be scanned with --sector-size 4096)
+SECTOR_SIZE = 512
 
-    # Open the disk, get the contents, and convert to hex
-    with open(inputDisk, 'rb') as diskImage:
-        hexData = diskImage.read().hex()
-    print('Disk contents collected...')
-    diskImage.close()
+# Number of bytes at the start of each sector compared against the signatures when building the sector index
+# (none of the signatures are longer than this)
+SECTOR_PREFIX = 8
 
-    print('Disk image closed...\n')
-    # Return the hex contents
-    return hexData
+# Default size of each piece of the disk image read at a time when scanning in chunked mode (64 MiB)
+CHUNK_SIZE = 64 * 1024 * 1024
 
-# locateAndRecoverFiles: loops through our signatures dictionary and for each signature finds the corresponding files 
-#                        on the disk image and recovers them
-def locateAndRecoverFiles(diskContents):
-    print('Begin looking for file signatures (this process can take a minute or two)...')
-    # Initialize the number of files currently found 
-    numFilesFound = 0
+# Compressed disk images are decompressed one block at a time, and the most recently used blocks are kept in a cache
+# (1 MiB blocks, 64 MiB of cache by default, which can be changed with --cache-size)
+IMAGE_BLOCK_SIZE = 1024 * 1024
+BLOCK_CACHE_SIZE = 64 * 1024 * 1024
+
+# How far apart the seek points of a compressed disk image are, so reading any block only needs decompressing at most
+# this much of the image first (16 MiB)
+SEEK_POINT_SPACING = 16 * 1024 * 1024
 
-    # Go through all of the file signatures that we want to find on the disk
+# Size of each piece of a compressed disk image read at a time (64 KiB)
+COMPRESSED_READ_SIZE = 64 * 1024
+
+# Size of the buffer used when recovered files have to be copied through Python instead of by the kernel (1 MiB)
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Hashes computed for every recovered file while it is being copied out (the names hashlib uses for them)
+HASH_ALGORITHMS = ['sha256', 'sha1', 'md5']
+
+# How each hash is labelled when it is printed
+HASH_LABELS = {'sha256': 'SHA-256', 'sha1': 'SHA-1', 'md5': 'MD5'}
+
+# Files at least this big are copied out and hashed on a separate thread so the rest of the disk can keep being
+# processed in the meantime (8 MiB)
+LARGE_FILE_SIZE = 8 * 1024 * 1024
+
+# Number of threads used to copy out and hash large files
+HASH_WORKERS = 4
+
+# Size of each region of the disk image scanned before the files found in it are carved, so the first files are reported
+# while the rest of the disk is still being scanned (64 MiB, a whole number of sectors)
+SCAN_BATCH_SIZE = 64 * 1024 * 1024
+
+# Size of the buffer that manifest records are collected in before they are written out (64 KiB)
+MANIFEST_BUFFER_SIZE = 64 * 1024
+
+# How often the live progress line is redrawn while the disk image is scanned (in seconds)
+PROGRESS_INTERVAL = 0.5
+
+# What is counted for the headers of each type: every header found, headers that are not at the start of a sector,
+# headers inside the last file recovered of that type, headers that fail the checks on them (or whose end cannot be
+# found), and the files recovered
+SIGNATURE_COUNTERS = ['raw', 'misaligned', 'insideFile', 'rejected', 'accepted']
+
+# Number of regions the disk image is split into for each process when scanning with --jobs, so a process that gets
+# a busy region does not hold up the others
+REGIONS_PER_JOB = 4
+
+# Number of pieces for each process that are handed to the pool ahead of the one the carvers are waiting for
+PIECES_IN_FLIGHT = 2
+
+# Size of the piece of the disk image kept in memory while a structural carver walks through a file (1 MiB)
+STRUCTURE_BUFFER_SIZE = 1024 * 1024
+
+# Size of the window that every header and footer is searched for in before moving on, small enough to stay in the
+# CPU cache so all of the patterns are matched against bytes that were only read from the disk once (1 MiB)
+SCAN_WINDOW = 1024 * 1024
+
+# Number of bytes at the start of every pattern that candidate matches are found by (with NumPy, each pair of bytes in a
+# window is looked up in a table of the pairs the patterns start with, in one pass for all of the patterns)
+PATTERN_PREFIX = 2
+
+# Size of the blocks that are checked for being all zeros (or all one fill byte) before they are searched, so empty
+# space on the disk is skipped instead of being matched against every pattern (64 KiB)
+SKIP_BLOCK_SIZE = 64 * 1024
+ZERO_BLOCK = bytes(SKIP_BLOCK_SIZE)
+
+# How much of a hole in a sparse disk image is still scanned before the data that follows it, since a header or footer
+# that starts with zeros (like the MPG ones) can start in the hole (longer than any of the patterns, and a whole number
+# of sectors)
+SKIP_MARGIN = 4096
+
+# IMAGE SOURCES
+
+# Notes for image sources: a source presents the evidence as one device that any byte range can be read from, whether
+#                          it is a single raw file, a raw image split into segments (.001, .002, ...), or a gzip or zstd
+#                          compressed raw image, so nothing has to be joined or decompressed to scratch disk first.
+#                          Sources that are cheap to open again can be scanned by several processes (reopenable)
+
+# RawSource: a disk image that is a single plain file
+class RawSource:
+    reopenable = True
+    description = 'raw'
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+
+    # read: returns length bytes starting at offset (fewer if the end of the image is reached)
+    def read(self, offset, length):
+        return os.pread(self.file.fileno(), length, offset)
+
+    # dataExtents: returns the (start, end) byte ranges of the image that are not holes in a sparse file
+    def dataExtents(self):
+        return findDataExtents(self.file.fileno(), self.size)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+# SplitRawSource: a raw disk image split into segments, read as if the segments were joined in order
+class SplitRawSource:
+    reopenable = True
+
+    def __init__(self, paths):
+        self.path = paths[0]
+        self.files = [open(path, 'rb') for path in paths]
+        # Offset of the start of each segment within the whole image
+        self.starts = []
+        self.size = 0
+        for segmentFile in self.files:
+            self.starts.append(self.size)
+            self.size = self.size + os.fstat(segmentFile.fileno()).st_size
+        self.description = 'split raw, ' + str(len(paths)) + ' segments'
+
+    # read: returns length bytes starting at offset (fewer if the end of the image is reached), reading across
+    #       segment boundaries as needed
+    def read(self, offset, length):
+        pieces = []
+        segment = bisect.bisect_right(self.starts, offset) - 1
+        while length > 0 and 0 <= segment < len(self.files):
+            piece = os.pread(self.files[segment].fileno(), length, offset - self.starts[segment])
+            if not piece:
+                segment = segment + 1
+                continue
+            pieces.append(piece)
+            offset = offset + len(piece)
+            length = length - len(piece)
+        return b''.join(pieces)
+
+    # dataExtents: returns the (start, end) byte ranges of the image that are not holes in any of the sparse segments
+    def dataExtents(self):
+        extents = []
+        for segmentFile, start in zip(self.files, self.starts):
+            segmentSize = os.fstat(segmentFile.fileno()).st_size
+            extents.extend((start + dataStart, start + dataEnd) for dataStart, dataEnd in
+                findDataExtents(segmentFile.fileno(), segmentSize))
+        return mergeExtents(extents, self.size)
+
+    # fileno: the image is not one file, so recovered files cannot be copied out by the kernel
+    def fileno(self):
+        return None
+
+    def close(self):
+        for segmentFile in self.files:
+            segmentFile.close()
+
+# GzipDecoder: decompresses a gzip file (made of one or more gzip members) from the start, a piece at a time. A copy of
+#              the decoder carries on from the same place, which is what the seek points of a gzip image are made of
+class GzipDecoder:
+    def __init__(self, fd):
+        self.fd = fd
+        self.compressedOffset = 0
+        self.pending = b''
+        self.decompressor = zlib.decompressobj(31) # 31 means the data has a gzip header and trailer
+        self.memberStart = True
+        self.finished = False
+
+    # read: returns up to maxLength (more than 0) bytes of decompressed data, or nothing at the end of the image
+    def read(self, maxLength):
+        while not self.finished:
+            if not self.pending:
+                self.pending = os.pread(self.fd, COMPRESSED_READ_SIZE, self.compressedOffset)
+                self.compressedOffset = self.compressedOffset + len(self.pending)
+                if not self.pending:
+                    self.finished = True
+                    break
+            try:
+                data = self.decompressor.decompress(self.pending, maxLength)
+            except zlib.error:
+                # Padding (or anything else that is not gzip data) after the last member is the end of the image
+                if self.memberStart:
+                    self.finished = True
+                    break
+                raise
+            self.memberStart = False
+            self.pending = self.decompressor.unconsumed_tail
+            if self.decompressor.eof:
+                # Another gzip member can follow this one
+                self.pending = self.decompressor.unused_data + self.pending
+                self.decompressor = zlib.decompressobj(31)
+                self.memberStart = True
+            if data:
+                return data
+        return b''
+
+    def copy(self):
+        decoder = GzipDecoder.__new__(GzipDecoder)
+        decoder.__dict__.update(self.__dict__)
+        decoder.decompressor = self.decompressor.copy()
+        return decoder
+
+    # seekPoint: returns a copy of the decoder to carry on from later (a copy of the decompressor can go on from anywhere)
+    def seekPoint(self):
+        return self.copy()
+
+    def close(self):
+        pass
+
+# zstdFrameSize: returns the compressed size of the zstd frame (or skippable frame) at offset of the open file fd, found
+#                by walking the headers of its blocks, and whether it is a skippable frame. Returns None if there is no
+#                frame at offset (the end of the image, or padding after the last frame)
+def zstdFrameSize(fd, offset):
+    header = os.pread(fd, 14, offset)
+    if len(header) >= 8 and header[0] & 0xf0 == 0x50 and header[1:4] == b'\x2a\x4d\x18':
+        return 8 + int.from_bytes(header[4:8], 'little'), True
+    if len(header) < 6 or header[0:4] != b'\x28\xb5\x2f\xfd':
+        return None
+    descriptor = header[4]
+    singleSegment = (descriptor >> 5) & 1
+    contentSizeBytes = (1 if singleSegment else 0, 2, 4, 8)[descriptor >> 6]
+    position = offset + 5 + (1 - singleSegment) + (0, 1, 2, 4)[descriptor & 3] + contentSizeBytes
+    while True:
+        blockHeader = os.pread(fd, 3, position)
+        if len(blockHeader) < 3:
+            break
+        blockHeader = int.from_bytes(blockHeader, 'little')
+        # A run length block stores its byte once, whatever size it decompresses to
+        position = position + 3 + (1 if (blockHeader >> 1) & 3 == 1 else blockHeader >> 3)
+        if blockHeader & 1:
+            break
+    # The frame can end with a checksum
+    if (descriptor >> 2) & 1:
+        position = position + 4
+    return position - offset, False
+
+# FrameFile: reads the byte range of an open file that one zstd frame takes up, so the zstd stream reader decompressing
+#            it cannot run on into the frames after it
+class FrameFile:
+    def __init__(self, fd, start, end):
+        self.fd = fd
+        self.position = start
+        self.end = end
+
+    def read(self, size = -1):
+        if size < 0:
+            size = self.end - self.position
+        data = os.pread(self.fd, min(size, self.end - self.position), self.position)
+        self.position = self.position + len(data)
+        return data
+
+# ZstdDecoder: decompresses a zstd file one frame at a time, a piece at a time, starting from the frame at frameOffset
+#              (skipping the first skip bytes of it). The state of a zstd decompressor cannot be copied, but every frame
+#              can be decompressed on its own, so a seek point is the compressed offset of a frame and how far into it
+#              the seek point is. The file is only opened once the decoder is read from
+class ZstdDecoder:
+    def __init__(self, path, frameOffset = 0, skip = 0):
+        self.path = path
+        self.file = None
+        self.reader = None
+        self.frameOffset = frameOffset
+        self.nextFrame = frameOffset
+        self.framePosition = 0
+        self.skip = skip
+        self.numFrames = 0
+        # The frame the last seek point was in (a seek point in the first frame is no better than the start of the file)
+        self.seekPointFrame = 0
+
+    # read: returns up to maxLength (more than 0) bytes of decompressed data, or nothing at the end of the image
+    def read(self, maxLength):
+        if self.file is None:
+            self.file = open(self.path, 'rb')
+        while True:
+            if self.reader is None:
+                frame = zstdFrameSize(self.file.fileno(), self.nextFrame)
+                if frame is None:
+                    return b''
+                frameSize, skippable = frame
+                self.frameOffset = self.nextFrame
+                self.nextFrame = self.nextFrame + frameSize
+                self.framePosition = 0
+                if skippable:
+                    continue
+                self.numFrames = self.numFrames + 1
+                frameFile = FrameFile(self.file.fileno(), self.frameOffset, self.nextFrame)
+                self.reader = zstandard.ZstdDecompressor().stream_reader(frameFile, closefd = False)
+            while self.skip > 0:
+                data = self.reader.read(min(self.skip, IMAGE_BLOCK_SIZE))
+                if not data:
+                    break
+                self.skip = self.skip - len(data)
+                self.framePosition = self.framePosition + len(data)
+            data = self.reader.read(maxLength)
+            if data:
+                self.framePosition = self.framePosition + len(data)
+                return data
+            self.reader.close()
+            self.reader = None
+
+    # copy: returns a decoder that starts from the same place (by decompressing the frame it is in again up to there)
+    def copy(self):
+        return ZstdDecoder(self.path, self.frameOffset, self.framePosition + self.skip)
+
+    # seekPoint: returns a copy of the decoder to carry on from later, or None if it is still in the first frame or the
+    #            frame of the last seek point (starting from there would be just as quick)
+    def seekPoint(self):
+        if self.frameOffset == self.seekPointFrame:
+            return None
+        self.seekPointFrame = self.frameOffset
+        return self.copy()
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+        if self.file is not None:
+            self.file.close()
+
+# CompressedSource: a compressed raw disk image, read a block at a time. Opening it decompresses it once (without
+#                   keeping the data) to find its size and to save a seek point every SEEK_POINT_SPACING bytes. A block
+#                   is then read by carrying on from the last block that was decompressed if it is just ahead, or by
+#                   starting from the closest seek point before it, and recently used blocks are kept in an LRU cache
+class CompressedSource:
+    reopenable = False
+
+    def __init__(self, path, compression, cacheSize = BLOCK_CACHE_SIZE):
+        self.path = path
+        self.compression = compression
+        self.description = compression + ' compressed'
+        self.file = open(path, 'rb')
+        self.cacheBlocks = max(1, cacheSize // IMAGE_BLOCK_SIZE)
+        self.cache = collections.OrderedDict()
+        # Extraction threads read the image while the scan does, and the decoders are shared between them
+        self.lock = threading.Lock()
+        self.cursor = None
+        self.cursorPosition = 0
+
+        # Decompress the whole image once to find its size and save the seek points
+        self.seekPoints = [0]
+        self.snapshots = [None]
+        decoder = self.openDecoder()
+        position = 0
+        while True:
+            data = decoder.read(IMAGE_BLOCK_SIZE - position % IMAGE_BLOCK_SIZE)
+            if not data:
+                break
+            position = position + len(data)
+            if position % SEEK_POINT_SPACING == 0:
+                snapshot = decoder.seekPoint()
+                if snapshot is not None:
+                    self.seekPoints.append(position)
+                    self.snapshots.append(snapshot)
+        decoder.close()
+        self.size = position
+        if compression == 'zstd' and decoder.numFrames == 1 and self.size > SEEK_POINT_SPACING:
+            print('Warning: ' + path + ' is a single zstd frame, so every read that goes back in it decompresses it from the ' +
+                'start again (compressing it into many frames, like pzstd does, makes it seekable)...')
+
+    # openDecoder: starts decompressing the image from the beginning
+    def openDecoder(self):
+        if self.compression == 'gzip':
+            return GzipDecoder(self.file.fileno())
+        return ZstdDecoder(self.path)
+
+    # readBlock: decompresses the next block (or what is left of the image) from the decoder at position
+    def readBlock(self, decoder, position):
+        pieces = []
+        blockEnd = position - position % IMAGE_BLOCK_SIZE + IMAGE_BLOCK_SIZE
+        while position < blockEnd:
+            data = decoder.read(blockEnd - position)
+            if not data:
+                break
+            pieces.append(data)
+            position = position + len(data)
+        return b''.join(pieces)
+
+    # getBlock: returns the decompressed block with the given number from the cache, or decompresses it (caching the
+    #           blocks decompressed on the way to it)
+    def getBlock(self, blockNumber):
+        block = self.cache.get(blockNumber)
+        if block is not None:
+            self.cache.move_to_end(blockNumber)
+            return block
+
+        blockStart = blockNumber * IMAGE_BLOCK_SIZE
+        point = bisect.bisect_right(self.seekPoints, blockStart) - 1
+        if self.cursor is None or not (self.seekPoints[point] <= self.cursorPosition <= blockStart):
+            if self.cursor is not None:
+                self.cursor.close()
+            snapshot = self.snapshots[point]
+            self.cursor = snapshot.copy() if snapshot is not None else self.openDecoder()
+            self.cursorPosition = self.seekPoints[point]
+
+        block = b''
+        while self.cursorPosition <= blockStart:
+            block = self.readBlock(self.cursor, self.cursorPosition)
+            if not block:
+                break
+            self.cache[self.cursorPosition // IMAGE_BLOCK_SIZE] = block
+            if len(self.cache) > self.cacheBlocks:
+                self.cache.popitem(last = False)
+            self.cursorPosition = self.cursorPosition + len(block)
+        return block
+
+    # read: returns length bytes starting at offset (fewer if the end of the image is reached)
+    def read(self, offset, length):
+        endOffset = min(offset + length, self.size)
+        pieces = []
+        with self.lock:
+            while offset < endOffset:
+                blockNumber = offset // IMAGE_BLOCK_SIZE
+                blockOffset = offset - blockNumber * IMAGE_BLOCK_SIZE
+                piece = self.getBlock(blockNumber)[blockOffset:(blockOffset + endOffset - offset)]
+                if not piece:
+                    break
+                pieces.append(piece)
+                offset = offset + len(piece)
+        return pieces[0] if len(pieces) == 1 else b''.join(pieces)
+
+    # dataExtents: holes in the compressed file say nothing about the image inside it, so all of it is data
+    def dataExtents(self):
+        return [(0, self.size)] if self.size > 0 else []
+
+    # fileno: the image has to be decompressed, so recovered files cannot be copied out by the kernel
+    def fileno(self):
+        return None
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+        self.file.close()
+
+# findDataExtents: returns the (start, end) byte ranges of the open file fd (of the given size) that hold data, by asking
+#                  the file system to skip over its holes with SEEK_DATA and SEEK_HOLE. If the operating system or file
+#                  system cannot tell, the whole file is data
+def findDataExtents(fd, size):
+    if not hasattr(os, 'SEEK_DATA') or size <= 0:
+        return [(0, size)] if size > 0 else []
+    extents = []
+    position = 0
+    try:
+        while position < size:
+            try:
+                start = os.lseek(fd, position, os.SEEK_DATA)
+            except OSError as error:
+                # ENXIO means there is no more data after position (the rest of the file is a hole)
+                if error.errno == errno.ENXIO:
+                    break
+                raise
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            if start >= end:
+                break
+            extents.append((start, end))
+            position = end
+    except OSError:
+        return [(0, size)]
+    return extents
+
+# findSegments: returns the paths of the segments of a split raw image (path.001, path.002, ... starting from the
+#               segment given), or just the path if it is not a segment
+def findSegments(path):
+    match = re.search(r'\.(\d{3})$', path)
+    if match is None:
+        return [path]
+    paths = []
+    number = int(match.group(1))
+    while os.path.exists(path[:match.start(1)] + '%03d' % number):
+        paths.append(path[:match.start(1)] + '%03d' % number)
+        number = number + 1
+    return paths
+
+# imageCompression: returns 'gzip' or 'zstd' if the disk image is compressed (going by the first bytes of the file), or
+#                   None if it is raw
+def imageCompression(path):
+    with open(path, 'rb') as imageFile:
+        magic = imageFile.read(4)
+    if magic[:2] == b'\x1f\x8b':
+        return 'gzip'
+    if magic == b'\x28\xb5\x2f\xfd':
+        return 'zstd'
+    return None
+
+# openImageSource: opens a disk image as the right kind of source, going by the first bytes of the file (gzip and zstd
+#                  images) and its name (split raw segments)
+def openImageSource(path, cacheSize = BLOCK_CACHE_SIZE):
+    compression = imageCompression(path)
+    if compression == 'gzip':
+        return CompressedSource(path, 'gzip', cacheSize)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('Reading zstd compressed disk images needs the zstandard module (pip install zstandard)')
+        return CompressedSource(path, 'zstd', cacheSize)
+    segments = findSegments(path)
+    if len(segments) > 1:
+        return SplitRawSource(segments)
+    return RawSource(path)
+
+# DISK IMAGE ACCESS
+
+# MappedDiskImage: gives access to the raw bytes of the disk image through a read-only memory map, so the operating
+#                  system pages the image in and out as needed instead of the whole image being loaded into memory
+#                  (only for raw images that are a single file)
+class MappedDiskImage:
+    scanMode = 'mmap'
+
+    def __init__(self, source, chunkSize = CHUNK_SIZE):
+        self.source = source
+        self.path = source.path
+        self.chunkSize = chunkSize
+        self.size = source.size
+        self.data = mmap.mmap(source.fileno(), 0, access = mmap.ACCESS_READ)
+
+    # findAll: finds every pattern that starts in [start, end) of the disk in a single pass and adds (offset, kind, name)
+    #          hits to the hits list (and the ranges of empty blocks it skipped to the skipped list)
+    def findAll(self, patterns, hits, start = 0, end = None, skipped = None):
+        if end is None or end > self.size:
+            end = self.size
+        # Let a match that starts before the end of the region run past it
+        overlap = max(len(pattern) for pattern in patterns.values()) - 1
+        searchBuffer(self.data, start, end, min(end + overlap, self.size), 0, patterns, hits, skipped)
+
+    # indexSectors: adds the offset of every sector in [start, end) that starts with a signature to the sector index
+    #               (sectors are counted from the start of the disk, so a region that does not start on a sector, like
+    #               the unallocated space of a volume with 512-byte clusters, begins at the next one)
+    def indexSectors(self, sectorSize, index, start = 0, end = None):
+        if end is None or end > self.size:
+            end = self.size
+        start = -(-start // sectorSize) * sectorSize
+        indexBuffer(self.data, start, end, 0, sectorSize, index)
+
+    # read: returns length bytes starting at offset (fewer if the end of the image is reached)
+    def read(self, offset, length):
+        return self.data[offset:(offset + length)]
+
+    # dataExtents: returns the (start, end) byte ranges of the disk that are not holes in a sparse image
+    def dataExtents(self):
+        return self.source.dataExtents()
+
+    # fileno: returns the file descriptor of the disk image so recovered files can be copied out by the kernel
+    def fileno(self):
+        return self.source.fileno()
+
+    def close(self):
+        self.data.close()
+        self.source.close()
+
+# ChunkedDiskImage: gives access to the raw bytes of the disk image by reading fixed-size chunks from its source, so
+#                   peak memory is bounded by the chunk size no matter how big the image is
+class ChunkedDiskImage:
+    scanMode = 'chunked'
+
+    def __init__(self, source, chunkSize = CHUNK_SIZE):
+        self.source = source
+        self.path = source.path
+        self.chunkSize = chunkSize
+        self.size = source.size
+
+    # findAll: finds every pattern that starts in [start, end) of the disk in a single pass and adds (offset, kind, name)
+    #          hits to the hits list (and the ranges of empty blocks it skipped to the skipped list)
+    def findAll(self, patterns, hits, start = 0, end = None, skipped = None):
+        if end is None or end > self.size:
+            end = self.size
+        # Each chunk also holds the start of the next one so a pattern that crosses the boundary is still found
+        overlap = max(len(pattern) for pattern in patterns.values()) - 1
+        for position in range(start, end, self.chunkSize):
+            chunk = self.read(position, self.chunkSize + overlap)
+            searchBuffer(chunk, 0, min(self.chunkSize, end - position, len(chunk)), len(chunk), position, patterns, hits,
+                skipped)
+
+    # indexSectors: adds the offset of every sector in [start, end) that starts with a signature to the sector index
+    #               (sectors are counted from the start of the disk, so a region that does not start on a sector, like
+    #               the unallocated space of a volume with 512-byte clusters, begins at the next one)
+    def indexSectors(self, sectorSize, index, start = 0, end = None):
+        if end is None or end > self.size:
+            end = self.size
+        start = -(-start // sectorSize) * sectorSize
+        # Read whole sectors at a time so every chunk starts at the beginning of a sector
+        chunkSize = max(sectorSize, self.chunkSize - (self.chunkSize % sectorSize))
+        for position in range(start, end, chunkSize):
+            chunk = self.read(position, min(chunkSize, end - position))
+            indexBuffer(chunk, 0, len(chunk), position, sectorSize, index)
+
+    # read: returns length bytes starting at offset (fewer if the end of the image is reached)
+    def read(self, offset, length):
+        return self.source.read(offset, length)
+
+    # dataExtents: returns the (start, end) byte ranges of the disk that are not holes in a sparse image
+    def dataExtents(self):
+        return self.source.dataExtents()
+
+    # fileno: returns the file descriptor of the disk image so recovered files can be copied out by the kernel (or None
+    #         if the image is not a single raw file)
+    def fileno(self):
+        return self.source.fileno()
+
+    def close(self):
+        self.source.close()
+
+# SIGNATURE SEARCH
+
+# HitList: every header and footer found on the disk, sorted by offset, so the carvers can look up the footer that
+#          belongs to a header without searching the disk again
+class HitList:
+    def __init__(self, hits = None, keepHits = False):
+        # Every hit is only kept if asked for (to save them in the scan index), otherwise only the footers that a header
+        # still to be carved could need are kept, so the list does not grow with the size of the disk
+        self.keepHits = keepHits
+        self.hits = []
+        # Footers are kept as a sorted list of offsets for each footer name
+        self.trailers = {name: [] for name in trailers}
+        if hits is not None:
+            self.add(hits)
+
+    # add: adds a batch of hits and returns the new (offset, signature name) headers. Batches usually come after the hits
+    #      already in the list (a scan goes through the disk in order), but one from earlier on the disk (when unallocated
+    #      space is scanned first) is merged in
+    def add(self, hits):
+        hits.sort()
+        headers = [(offset, name) for offset, kind, name in hits if kind == 'header']
+        if self.keepHits:
+            inOrder = not self.hits or not hits or self.hits[-1] <= hits[0]
+            self.hits.extend(hits)
+            if not inOrder:
+                self.hits.sort()
+        for name in trailers:
+            offsets = self.trailers.setdefault(name, [])
+            newOffsets = [offset for offset, kind, hitName in hits if kind == 'trailer' and hitName == name]
+            if newOffsets:
+                inOrder = not offsets or offsets[-1] <= newOffsets[0]
+                offsets.extend(newOffsets)
+                if not inOrder:
+                    offsets.sort()
+        return headers
+
+    # prune: drops the footers before offset, once no header still to be carved can start before it
+    def prune(self, offset):
+        for offsets in self.trailers.values():
+            del offsets[:bisect.bisect_left(offsets, offset)]
+
+    # findTrailer: returns the offset of the first footer of the given name in [start, end), or -1 if there is none
+    def findTrailer(self, name, start, end = None):
+        offsets = self.trailers.get(name, [])
+        index = bisect.bisect_left(offsets, start)
+        if index == len(offsets) or (end is not None and offsets[index] >= end):
+            return -1
+        return offsets[index]
+
+# fillByte: returns the byte that every byte of buffer[start:end] is, or None if they are not all the same
+def fillByte(buffer, start, end):
+    # Data almost never has the same first, middle, and last byte, so most blocks are ruled out without reading them
+    first = buffer[start]
+    if buffer[end - 1] != first or buffer[(start + end) // 2] != first:
+        return None
+    block = buffer[start:end]
+    if first == 0:
+        return 0 if block == ZERO_BLOCK else None
+    return first if block.count(block[:1]) == len(block) else None
+
+# findDataRanges: splits [start, end) of buffer into SKIP_BLOCK_SIZE blocks and returns the (start, end) ranges that
+#                 still have to be searched, leaving out the blocks that are all zeros or all one fill byte. A pattern
+#                 can still start at the last overlap bytes of an empty block and run into the data after it, so those
+#                 are searched too (unless the next block is empty as well). The skipped blocks are added to the skipped
+#                 list as (start, end, reason) disk ranges, joining ranges that touch
+def findDataRanges(buffer, start, end, overlap, bufferOffset, skipped = None):
+    ranges = []
+    rangeStart = start
+    lastFill = None
+    for blockStart in range(start, end - SKIP_BLOCK_SIZE + 1, SKIP_BLOCK_SIZE):
+        blockEnd = blockStart + SKIP_BLOCK_SIZE
+        fill = fillByte(buffer, blockStart, blockEnd)
+        if fill is None:
+            lastFill = None
+            continue
+        if rangeStart < blockStart and fill != lastFill:
+            ranges.append((rangeStart, blockStart))
+        rangeStart = blockEnd - overlap
+        lastFill = fill
+        if skipped is not None:
+            reason = 'zero' if fill == 0 else 'fill ' + hex(fill)
+            if skipped and skipped[-1][1] == bufferOffset + blockStart and skipped[-1][2] == reason:
+                skipped[-1] = (skipped[-1][0], bufferOffset + blockEnd, reason)
+            else:
+                skipped.append((bufferOffset + blockStart, bufferOffset + blockEnd, reason))
+    if rangeStart < end:
+        ranges.append((rangeStart, end))
+    return ranges
+
+# groupPatterns: groups the patterns by their first PATTERN_PREFIX bytes and returns a dictionary of those bytes to a list
+#                of ((kind, name), pattern) for every pattern in the group
+def groupPatterns(patterns):
+    groups = {}
+    for key, pattern in patterns.items():
+        groups.setdefault(pattern[:PATTERN_PREFIX], []).append((key, pattern))
+    return groups
+
+# prefixTable: returns a NumPy table with an entry for every possible little endian pair of bytes that is True for the
+#              pairs the groups start with (or None without NumPy)
+def prefixTable(groups):
+    if numpy is None:
+        return None
+    table = numpy.zeros(1 << (8 * PATTERN_PREFIX), dtype = numpy.bool_)
+    for prefix in groups:
+        if len(prefix) == PATTERN_PREFIX:
+            table[int.from_bytes(prefix, 'little')] = True
+    return table
+
+# findCandidates: returns the offsets in [start, limit) of buffer where a pair of bytes in the prefix table starts (only
+#                 bytes before end are looked at)
+def findCandidates(buffer, start, limit, end, table):
+    data = numpy.frombuffer(buffer, dtype = numpy.uint8, count = min(limit + 1, end) - start, offset = start)
+    pairs = data[:-1].astype(numpy.uint16) | (data[1:].astype(numpy.uint16) << 8)
+    return (numpy.flatnonzero(table[pairs]) + start).tolist()
+
+# addMatches: adds a hit for every pattern of a group that starts at position of buffer (and ends before end)
+def addMatches(buffer, position, end, members, bufferOffset, hits):
+    for (kind, name), pattern in members:
+        if buffer[position:min(position + len(pattern), end)] == pattern:
+            hits.append((bufferOffset + position, kind, name))
+
+# searchBuffer: finds every pattern that starts in [start, limit) of buffer (matches may run on to end) and adds the
+#               hits to the hits list, with bufferOffset added so they are offsets on the disk. Blocks that are all
+#               zeros or all one fill byte are skipped, and added to the skipped list if one is given
+def searchBuffer(buffer, start, limit, end, bufferOffset, patterns, hits, skipped = None):
+    # None of the patterns is a single byte over and over, so one can only be in an empty block if it runs out of it
+    overlap = max(len(pattern) for pattern in patterns.values()) - 1
+    groups = groupPatterns(patterns)
+    table = prefixTable(groups)
+    # Without NumPy (and for patterns shorter than the prefix) the bytes a group shares are searched for once per group
+    findGroups = [(os.path.commonprefix([pattern for key, pattern in members]), members) for prefix, members in groups.items()
+        if table is None or len(prefix) < PATTERN_PREFIX]
+    # Search one small window at a time with every pattern, so each window is only brought into the cache once
+    for windowStart in range(start, limit, SCAN_WINDOW):
+        windowEnd = min(windowStart + SCAN_WINDOW, limit)
+        for rangeStart, rangeEnd in findDataRanges(buffer, windowStart, windowEnd, overlap, bufferOffset, skipped):
+            if table is not None:
+                for position in findCandidates(buffer, rangeStart, rangeEnd, end, table):
+                    addMatches(buffer, position, end, groups[bytes(buffer[position:(position + PATTERN_PREFIX)])],
+                        bufferOffset, hits)
+            for prefix, members in findGroups:
+                # Let a match that starts in this range run past the end of it
+                searchEnd = min(rangeEnd + len(prefix) - 1, end)
+                index = buffer.find(prefix, rangeStart, searchEnd)
+                while index != -1:
+                    addMatches(buffer, index, end, members, bufferOffset, hits)
+                    index = buffer.find(prefix, index + 1, searchEnd)
+
+# matchSector: returns the name of the signature that the bytes at the start of a sector begin with, or None
+def matchSector(prefix):
     for sig in signatures:
-        # Find the file signature in the unsearched contents of the disk
-        searchLocation = 0 # Initially we want to start looking at the beginning of the disk (index 0)
-        sigLocation = diskContents.find(signatures[sig])
-
-        # While there are still file signatures of type sig loop through this
-        while sigLocation != -1:
-            # Check which signature has been found
-            if sig == 'MPG':
-		# Check that the signature is at the beginning of a sector and is not just part of file contents
-                if (sigLocation % 512) == 0:
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-		    # Check for one of the footers that mark the end of the file
-                    eof = diskContents.find(trailers['MPG1'], sigLocation)
-                    if eof == -1: # If the first footer is not found then it must have the second footer type
-                        eof = diskContents.find(trailers['MPG2'], sigLocation) 
-                    eof = eof + 7 # Add 7 to get the index of the last character of the trailer/footer
-					
-                    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.mpg' 
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2) 
-                    endOffset = int(math.ceil(eof / 2))
-                    fileSize = endOffset - startOffset
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ") 
-                    print('End Offset: ' + str(hex(endOffset)))
-
-		    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next mpg file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = eof
-
-                # If the signature is not at the start of a sector then move the search location past it 
-                else:
-                    searchLocation = sigLocation + 8
-
-            elif sig == 'PDF':
-                # Check that the signature is at the beginning of a sector and is not just part of file contents
-                if (sigLocation % 512) == 0:
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-		    # Check for one of the footers that mark the end of the file
-                    eof = diskContents.find(trailers['PDF1'], sigLocation)
-                    endOffset = 13 # Length of footer (not including trailing zeros that were added)
-                    if eof == -1: # If the first footer is not found then it must have one of the other footer type
-                        eof = diskContents.find(trailers['PDF2'], sigLocation) 
-                        endOffset = 17 # Length of footer (not including trailing zeros that were added)
-                    if eof == -1:
-                        eof = diskContents.find(trailers['PDF3'], sigLocation) 
-                        endOffset = 13 # Length of footer (not including trailing zeros that were added)
-                    if eof == -1:
-                        eof = diskContents.find(trailers['PDF4'], sigLocation) 
-                        endOffset = 11 # Length of footer (not including trailing zeros that were added)
-                    endOffset = endOffset + eof
-
-		    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.pdf'
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2)
-                    endOffset = int(math.ceil(endOffset / 2))
-                    fileSize = endOffset - startOffset
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ")
-                    print('End Offset: ' + str(hex(endOffset)))
-
-		    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next pdf file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = eof
-
-                # If the signature is not at the start of a sector then move the search location past it
-                else:
-                    searchLocation = sigLocation + 8
-
-            elif sig == 'BMP':
-                # Check that the signature is at the beginning of a sector and the reserved bits are present
-                # Since the bmp signature is so short, we check the reserved bits as well to be sure it is an actual file signature
-                if (sigLocation % 512) == 0 and (diskContents[(sigLocation + 12):(sigLocation + 20)] == '00000000'):
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-                    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.bmp'
-		    # Get the file size which is the next four bytes after the signature (little endian order)
-                    fileSize = (str(diskContents[(sigLocation + 10):(sigLocation + 12)]) + str(diskContents[(sigLocation + 8):(sigLocation + 10)]) +
-                        str(diskContents[(sigLocation + 6):(sigLocation + 8)]) + str(diskContents[(sigLocation + 4):(sigLocation + 6)]))
-                    fileSize = int(fileSize, 16) # Convert the size from hex to decimal
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2)
-                    endOffset = startOffset + fileSize
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ")
-                    print('End Offset: ' + str(hex(endOffset)))
-
-                    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next bmp file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = sigLocation + fileSize
-
-                # If the signature is not at the start of a sector then move the search location past it
-                else:
-                    searchLocation = sigLocation + 4
-
-            elif sig == 'GIF87a':
-                # Check that the signature is at the beginning of a sector and is not just part of file contents
-                if (sigLocation % 512) == 0:
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-		    # Check for the footer that marks the end of the file
-                    eof = diskContents.find(trailers['GIF'], sigLocation)
-                    eof = eof + 3 # Add 3 to get the index of the last character of the trailer/footer (not including trailing zeros that were added)
-
-		    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.gif'
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2)
-                    endOffset = int(math.ceil(eof / 2))
-                    fileSize = endOffset - startOffset
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ")
-                    print('End Offset: ' + str(hex(endOffset)))
-
-		    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next gif file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = eof
-
-                # If the signature is not at the start of a sector then move the search location past it
-                else:
-                    searchLocation = sigLocation + 12
-
-            elif sig == 'GIF89a':
-                # Check that the signature is at the beginning of a sector and is not just part of file contents
-                if (sigLocation % 512) == 0:
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-		    # Check for the footer that marks the end of the file
-                    eof = diskContents.find(trailers['GIF'], sigLocation)
-                    eof = eof + 3 # Add 3 to get the index of the last character of the trailer/footer (not including trailing zeros that were added)
-
-		    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.gif'
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2)
-                    endOffset = int(math.ceil(eof / 2))
-                    fileSize = endOffset - startOffset
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ")
-                    print('End Offset: ' + str(hex(endOffset)))
-
-		    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next gif file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = eof
-
-                # If the signature is not at the start of a sector then move the search location past it
+        if prefix.startswith(signatures[sig]):
+            return sig
+    return None
+
+# indexBuffer: checks the start of every whole or partial sector in [start, end) of buffer (start must be the beginning of
+#              a sector) against all of the signatures and adds the matching disk offsets to the sector index
+def indexBuffer(buffer, start, end, bufferOffset, sectorSize, index):
+    numSectors = (end - start) // sectorSize
+    position = start
+
+    if numpy is not None and numSectors > 0:
+        # View the buffer as a table with one row per sector and pack the first bytes of every row into a single
+        # little endian integer, so each signature is compared against all of the sectors with one vectorized operation
+        sectorsPerBlock = max(1, CHUNK_SIZE // sectorSize)
+        for blockStart in range(0, numSectors, sectorsPerBlock):
+            count = min(sectorsPerBlock, numSectors - blockStart)
+            blockOffset = start + blockStart * sectorSize
+            sectors = numpy.frombuffer(buffer, dtype = numpy.uint8, count = count * sectorSize, offset = blockOffset)
+            prefixes = numpy.ascontiguousarray(sectors.reshape(count, sectorSize)[:, :SECTOR_PREFIX]).view('<u8').ravel()
+            for sig in signatures:
+                # Only compare the bytes that are part of the signature by masking off the rest of the prefix
+                signature = signatures[sig]
+                value = int.from_bytes(signature, 'little')
+                mask = (1 << (8 * len(signature))) - 1
+                matches = numpy.flatnonzero((prefixes & numpy.uint64(mask)) == numpy.uint64(value))
+                offsets = matches.astype(numpy.int64) * sectorSize + (bufferOffset + blockOffset)
+                index[sig].frombytes(offsets.tobytes())
+        position = start + numSectors * sectorSize
+
+    # Without NumPy every sector is checked on its own (this also handles a partial sector at the end of the buffer)
+    while position < end:
+        sig = matchSector(bytes(buffer[position:min(position + SECTOR_PREFIX, end)]))
+        if sig is not None:
+            index[sig].append(bufferOffset + position)
+        position = position + sectorSize
+
+# buildSectorIndex: builds a compact array of the offsets of the sectors in [start, end) that start with each signature,
+#                   so headers can be found by only looking at the first few bytes of every sector instead of every byte
+def buildSectorIndex(diskImage, sectorSize, start = 0, end = None):
+    index = {sig: array.array('q') for sig in signatures}
+    diskImage.indexSectors(sectorSize, index, start, end)
+    return index
+
+# searchPatterns: returns the (kind, name) keys and bytes of every header and footer to search for (if a sector size
+#                 is given for the sector index, the headers come from the index instead of being searched for)
+def searchPatterns(indexSectorSize = None):
+    patterns = {}
+    if indexSectorSize is None:
+        for sig in signatures:
+            patterns[('header', sig)] = signatures[sig]
+    for trailer in trailers:
+        patterns[('trailer', trailer)] = trailers[trailer]
+    return patterns
+
+# scanRegion: finds every header and footer that starts in [start, end) of the disk and returns them as a list of
+#             (offset, kind, name) hits (if a sector size is given for the sector index, the headers come from the index).
+#             If patternKeys is given, only the headers and footers with those (kind, name) keys are looked for, and if a
+#             skipped list is given the empty blocks that were not searched are added to it
+def scanRegion(diskImage, start, end, indexSectorSize = None, patternKeys = None, skipped = None):
+    patterns = searchPatterns(indexSectorSize)
+    if patternKeys is not None:
+        patterns = {key: patterns[key] for key in patterns if key in patternKeys}
+
+    hits = []
+    if patterns:
+        diskImage.findAll(patterns, hits, start, end, skipped)
+    if indexSectorSize is not None:
+        indexedSigs = [sig for sig in signatures if patternKeys is None or ('header', sig) in patternKeys]
+        if indexedSigs:
+            sectorIndex = buildSectorIndex(diskImage, indexSectorSize, start, end)
+            for sig in indexedSigs:
+                hits.extend((offset, 'header', sig) for offset in sectorIndex[sig])
+    return hits
+
+# scanRegionJob: runs scanRegion in a worker process, which opens its own view of the disk image (memory maps of the
+#                same file share the operating system's page cache), so only the region bounds and the hits are sent
+#                between processes instead of the contents of the disk. Returns the hits and the empty blocks it skipped
+def scanRegionJob(inputDisk, scanMode, chunkSize, start, end, indexSectorSize, patternKeys):
+    diskImage = createDiskImage(inputDisk, scanMode, chunkSize)
+    try:
+        skipped = []
+        return scanRegion(diskImage, start, end, indexSectorSize, patternKeys, skipped), skipped
+    finally:
+        diskImage.close()
+
+# splitRegions: splits [start, end) of the disk into about numRegions regions that all start at the beginning of a sector
+def splitRegions(start, end, numRegions, sectorSize = SECTOR_SIZE):
+    # Round the region size up to a whole number of the largest sector size so every region starts on a sector
+    alignment = max(sectorSize, 4096)
+    regionSize = -(-(end - start) // max(1, numRegions))
+    regionSize = max(alignment, -(-regionSize // alignment) * alignment)
+    return [(regionStart, min(regionStart + regionSize, end)) for regionStart in range(start, end, regionSize)]
+
+# findHits: finds every header and footer that starts in the given (start, end) regions of the disk (the whole disk if
+#           no regions are given) and returns the list of hits. With more than one job the regions are split up further
+#           and scanned by a pool of processes, and their hits are merged into the same list a single process would find
+def findHits(diskImage, indexSectorSize = None, jobs = 1, regions = None, patternKeys = None):
+    if regions is None:
+        regions = [(0, diskImage.size)] if diskImage.size > 0 else []
+    if jobs <= 1:
+        hits = []
+        for start, end in regions:
+            hits.extend(scanRegion(diskImage, start, end, indexSectorSize, patternKeys))
+        return hits
+
+    # Split the regions up so that every process gets several pieces to work on
+    totalSize = sum(end - start for start, end in regions)
+    jobRegions = []
+    for start, end in regions:
+        numRegions = -(-jobs * REGIONS_PER_JOB * (end - start) // max(1, totalSize))
+        jobRegions.extend(splitRegions(start, end, numRegions, indexSectorSize or SECTOR_SIZE))
+
+    hits = []
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        regionJobs = [pool.submit(scanRegionJob, diskImage.path, diskImage.scanMode, diskImage.chunkSize, start, end,
+            indexSectorSize, patternKeys) for start, end in jobRegions]
+        for regionJob in regionJobs:
+            hits.extend(regionJob.result()[0])
+
+    # Every hit belongs to the region it starts in, but drop any duplicates anyway
+    return list(set(hits))
+
+# streamHits: scans the given (start, end) regions of the disk (the whole disk if no regions are given) in order, one
+#             SCAN_BATCH_SIZE piece at a time, and yields (hits, frontier, bytes scanned, skipped ranges) for each piece,
+#             where every hit in the regions that starts before frontier has been found, so files can be carved while the
+#             rest of the disk is still being scanned. The last frontier is always the end of the disk. With more than one
+#             job the pieces are scanned by a pool of processes
+def streamHits(diskImage, indexSectorSize = None, jobs = 1, regions = None, stop = None):
+    if regions is None:
+        regions = [(0, diskImage.size)]
+    regions = [(start, end) for start, end in regions if start < end]
+    if not regions:
+        yield [], diskImage.size, 0, []
+        return
+
+    # Split the regions up (so every process has several pieces to work on when there is more than one job)
+    pieceSize = SCAN_BATCH_SIZE
+    if jobs > 1:
+        totalSize = sum(end - start for start, end in regions)
+        pieceSize = min(SCAN_BATCH_SIZE, splitRegions(0, totalSize, jobs * REGIONS_PER_JOB, indexSectorSize or SECTOR_SIZE)[0][1])
+    pieces = [(pieceStart, min(pieceStart + pieceSize, end)) for start, end in regions for pieceStart in range(start, end, pieceSize)]
+
+    if jobs <= 1:
+        for start, end in pieces:
+            skipped = []
+            yield scanRegion(diskImage, start, end, indexSectorSize, None, skipped), end, end - start, skipped
+    else:
+        # Hand the hits of the pieces on in disk order, with only a few pieces for each process in flight at a time so
+        # the hits of the whole disk do not pile up. If the consumer stops early, the pieces that have not started are
+        # cancelled and the ones being scanned are left to finish in the background instead of being waited for
+        pool = concurrent.futures.ProcessPoolExecutor(jobs)
+        finished = False
+        try:
+            regionJobs = collections.deque()
+            nextPiece = 0
+            while nextPiece < len(pieces) or regionJobs:
+                while nextPiece < len(pieces) and len(regionJobs) < jobs * PIECES_IN_FLIGHT:
+                    start, end = pieces[nextPiece]
+                    regionJobs.append((pool.submit(scanRegionJob, diskImage.path, diskImage.scanMode, diskImage.chunkSize,
+                        start, end, indexSectorSize, None), start, end))
+                    nextPiece = nextPiece + 1
+                regionJob, start, end = regionJobs.popleft()
+                # A stop event (from an async for loop that was left) ends the wait for the piece early
+                if stop is not None:
+                    while not concurrent.futures.wait([regionJob], ASYNC_STOP_CHECK).done:
+                        if stop.is_set():
+                            return
+                hits, skipped = regionJob.result()
+                yield hits, end, end - start, skipped
+            finished = True
+        finally:
+            pool.shutdown(wait = finished, cancel_futures = True)
+
+    # Nothing after the last region is scanned, so every hit there is already known
+    if pieces[-1][1] < diskImage.size:
+        yield [], diskImage.size, 0, []
+
+# SCAN INDEX CACHE
+
+# Notes for the scan index: the hits found on a disk image (and the files recovered from it) are saved in a gzipped JSON
+#                           file next to the image, so later runs on the same image can skip the scan. The index is
+#                           keyed by the image's size, the modification time of every segment of it, and a fingerprint
+#                           made from samples of every region of the image. When new signatures or footers are added
+#                           only they are searched for. The samples only show which regions changed while the size and
+#                           modification times still match (an edit between the samples would be missed), so once any
+#                           of them differs every region is scanned again.
+
+# Version of the scan index file format (indexes with any other version are ignored)
+SCAN_INDEX_VERSION = 1
+
+# Size of the regions that are fingerprinted and scanned again on their own when they change (64 MiB)
+FINGERPRINT_REGION_SIZE = 64 * 1024 * 1024
+
+# Size of each sample read from the start, middle, and end of a region for its fingerprint
+FINGERPRINT_SAMPLE_SIZE = 4096
+
+# How much of the region before a changed region is scanned again, since a header or footer that starts there can run
+# into the changed region (longer than any of the patterns, and a whole number of sectors)
+RESCAN_MARGIN = 4096
+
+# defaultScanIndexPath: returns where the scan index of a disk image is kept by default
+def defaultScanIndexPath(inputDisk):
+    return inputDisk + '.scanindex.json.gz'
+
+# fingerprintRegions: returns a list of (start, end, fingerprint) for every region of the disk, where the fingerprint is a
+#                     hash of the region's bounds and samples from its start, middle, and end
+def fingerprintRegions(diskImage):
+    regions = []
+    for start in range(0, diskImage.size, FINGERPRINT_REGION_SIZE):
+        end = min(start + FINGERPRINT_REGION_SIZE, diskImage.size)
+        fingerprint = hashlib.sha1((str(start) + ':' + str(end)).encode())
+        for sampleOffset in sorted({start, (start + end) // 2, max(start, end - FINGERPRINT_SAMPLE_SIZE)}):
+            fingerprint.update(diskImage.read(sampleOffset, min(FINGERPRINT_SAMPLE_SIZE, end - sampleOffset)))
+        regions.append((start, end, fingerprint.hexdigest()))
+    return regions
+
+# loadScanIndex: reads a scan index, returning None if there is none or it cannot be used (an old format, or one made
+#                with a different way of finding headers)
+def loadScanIndex(indexPath, headerMode):
+    try:
+        with gzip.open(indexPath, 'rt') as indexFile:
+            scanIndex = json.load(indexFile)
+    except (OSError, ValueError):
+        return None
+    if scanIndex.get('version') != SCAN_INDEX_VERSION or scanIndex.get('headerMode') != headerMode:
+        return None
+    return scanIndex
+
+# saveScanIndex: writes the scan index to a temporary file and then moves it into place, so a crash part way through never
+#                leaves a broken index behind
+def saveScanIndex(indexPath, scanIndex):
+    temporaryPath = indexPath + '.tmp'
+    try:
+        with gzip.open(temporaryPath, 'wt') as indexFile:
+            json.dump(scanIndex, indexFile)
+        os.replace(temporaryPath, indexPath)
+        return True
+    except OSError as error:
+        print('Could not save the scan index to ' + indexPath + ' (' + str(error) + ')...')
+        return False
+
+# cachedHitBatches: gets the hits from the scan index at indexPath, scanning only the regions of the disk that changed
+#                   and only for the headers and footers that are new since the index was made, and returns batches of
+#                   hits like streamHits does along with the new scan index (whose hits and files still have to be
+#                   filled in before it is saved). Without a usable index the whole disk is streamed. If (start, end)
+#                   regions are given, nothing outside of them is scanned
+def cachedHitBatches(diskImage, indexPath, indexSectorSize = None, jobs = 1, regions = None):
+    headerMode = 'sector' + str(indexSectorSize) if indexSectorSize is not None else 'all'
+    # Every segment of a split image can change on its own, so the modification time of each of them is kept
+    imageMtimes = [os.stat(path).st_mtime for path in findSegments(diskImage.path)]
+    scanRegions = regions if regions is not None else [(0, diskImage.size)]
+    regions = fingerprintRegions(diskImage)
+    # Every header and footer is recorded (even headers that come from the sector index) so new ones can be spotted
+    patterns = {kind + ':' + name: pattern.hex() for (kind, name), pattern in searchPatterns().items()}
+    scanIndex = loadScanIndex(indexPath, headerMode)
+
+    if scanIndex is None:
+        print('No usable scan index, scanning the whole disk image...')
+        hitBatches = streamHits(diskImage, indexSectorSize, jobs, scanRegions)
+    else:
+        # Hits can be kept if their region has not changed and they are for a header or footer that has not changed (the
+        # samples are only trusted to tell that while the image's size and modification time are the same as before)
+        cachedRegions = {(start, end): fingerprint for start, end, fingerprint in scanIndex['regions']}
+        if scanIndex.get('imageSize') != diskImage.size or scanIndex.get('imageMtime') != imageMtimes:
+            cachedRegions = {}
+        changedRegions = [(start, end) for start, end, fingerprint in regions if cachedRegions.get((start, end)) != fingerprint]
+        unchangedRegions = [(start, end) for start, end, fingerprint in regions if cachedRegions.get((start, end)) == fingerprint]
+        cachedPatterns = scanIndex['patterns']
+        newKeys = {tuple(key.split(':', 1)) for key in patterns if cachedPatterns.get(key) != patterns[key]}
+        keptKeys = {key for key in patterns if cachedPatterns.get(key) == patterns[key]}
+        # A hit that starts just before a changed region can run into it, so the end of the region before every changed
+        # region is scanned again as well (RESCAN_MARGIN keeps the start of the rescan on a sector)
+        changedRegions = [(max(0, start - RESCAN_MARGIN), end) for start, end in changedRegions]
+        unchangedStarts = {start for start, end in unchangedRegions}
+        hits = [(offset, kind, name) for offset, kind, name in scanIndex['hits'] if kind + ':' + name in keptKeys and
+            (offset // FINGERPRINT_REGION_SIZE) * FINGERPRINT_REGION_SIZE in unchangedStarts and
+            not any(start <= offset < end for start, end in changedRegions)]
+        print('Loaded scan index (' + str(len(hits)) + ' hits kept, ' + str(len(changedRegions)) + ' of ' +
+            str(len(regions)) + ' regions changed, ' + str(len(newKeys)) + ' new signatures or footers)...')
+
+        # Scan the changed regions for everything, and the rest of the disk only for new headers and footers
+        changedRegions = intersectExtents(changedRegions, scanRegions)
+        unchangedRegions = intersectExtents(unchangedRegions, scanRegions)
+        scannedBytes = 0
+        if changedRegions:
+            hits.extend(findHits(diskImage, indexSectorSize, jobs, changedRegions))
+            scannedBytes = scannedBytes + sum(end - start for start, end in changedRegions)
+        if newKeys and unchangedRegions:
+            hits.extend(findHits(diskImage, indexSectorSize, jobs, unchangedRegions, newKeys))
+            scannedBytes = scannedBytes + sum(end - start for start, end in unchangedRegions)
+
+        # The rescanned margins overlap the hits that were kept, so drop any duplicates
+        hitBatches = iter([(list(set(hits)), diskImage.size, scannedBytes, [])])
+
+    scanIndex = {'version': SCAN_INDEX_VERSION, 'headerMode': headerMode, 'imageSize': diskImage.size,
+        'imageMtime': imageMtimes, 'fingerprint': hashlib.sha1(''.join(f for s, e, f in regions).encode()).hexdigest(),
+        'regions': regions, 'patterns': patterns, 'hits': [],
+        'files': scanIndex['files'] if scanIndex is not None else []}
+    return hitBatches, scanIndex
+
+# FILE EXTRACTION
+
+# MultiHasher: feeds the same bytes to several hashlib hashes so all of them are computed in one pass over a file
+class MultiHasher:
+    def __init__(self, algorithms):
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+        # Time spent hashing (in seconds), so it can be told apart from the time spent copying the file
+        self.seconds = 0.0
+
+    def update(self, data):
+        startTime = time.perf_counter()
+        for hash in self.hashes.values():
+            hash.update(data)
+        self.seconds = self.seconds + time.perf_counter() - startTime
+
+    # hexdigests: returns a dictionary of algorithm name to hex digest
+    def hexdigests(self):
+        return {algorithm: self.hashes[algorithm].hexdigest() for algorithm in self.hashes}
+
+# readRange: reads length bytes starting at offset of the disk image one buffer at a time
+def readRange(diskImage, offset, length):
+    endOffset = offset + length
+    while offset < endOffset:
+        data = diskImage.read(offset, min(COPY_BUFFER_SIZE, endOffset - offset))
+        if not data:
+            break
+        yield data
+        offset = offset + len(data)
+
+# copyRange: copies length bytes starting at offset of the disk image into the output file, letting the kernel copy
+#            them straight from the image when it can and falling back on large reads and writes when it cannot
+def copyRange(diskImage, offset, length, outputFile):
+    outputFd = outputFile.fileno()
+    inputFd = diskImage.fileno()
+    endOffset = offset + length
+    # Split and compressed images are not one file the kernel can copy from
+    if inputFd is not None:
+        try:
+            while offset < endOffset:
+                copied = os.copy_file_range(inputFd, outputFd, endOffset - offset, offset)
+                if copied == 0:
+                    return
+                offset = offset + copied
+            return
+        except (AttributeError, OSError):
+            pass # copy_file_range is not supported here (or not between these file systems), so try sendfile instead
+
+        try:
+            os.lseek(outputFd, 0, os.SEEK_END)
+            while offset < endOffset:
+                copied = os.sendfile(outputFd, inputFd, offset, endOffset - offset)
+                if copied == 0:
+                    return
+                offset = offset + copied
+            return
+        except (AttributeError, OSError):
+            pass # sendfile is not supported either, so copy the bytes through a buffer
+
+    outputFile.seek(0, os.SEEK_END)
+    for data in readRange(diskImage, offset, endOffset - offset):
+        outputFile.write(data)
+
+# Notes for sinks: each sink's extract method copies length bytes starting at offset of the disk image into a file
+#                  called fileName, passing every byte through the hasher (if there is one) on the way, so the file
+#                  only has to be read once. Sinks that can have several files written at the same time are concurrent.
+
+# DirectorySink: writes each recovered file into a directory
+class DirectorySink:
+    concurrent = True
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+
+    def extract(self, fileName, diskImage, offset, length, hasher = None):
+        with open(os.path.join(self.path, fileName), 'wb') as outputFile:
+            # The kernel can only copy the file for us if we do not need to see the bytes to hash them
+            if hasher is None:
+                copyRange(diskImage, offset, length, outputFile)
+            else:
+                for data in readRange(diskImage, offset, length):
+                    hasher.update(data)
+                    outputFile.write(data)
+
+    # link: makes fileName a hard link to a file that was already written, returning False if it cannot be linked
+    def link(self, fileName, targetName):
+        try:
+            os.link(os.path.join(self.path, targetName), os.path.join(self.path, fileName))
+            return True
+        except OSError:
+            return False
+
+    def close(self):
+        pass
+
+# TarSink: writes each recovered file into a tar file
+class TarSink:
+    concurrent = False
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = tarfile.open(path, 'w', copybufsize = COPY_BUFFER_SIZE)
+
+    def extract(self, fileName, diskImage, offset, length, hasher = None):
+        fileInfo = tarfile.TarInfo(fileName)
+        fileInfo.size = length
+        self.archive.addfile(fileInfo, RangeReader(diskImage, offset, length, hasher))
+
+    # link: adds fileName to the tar file as a hard link to a file that was already added
+    def link(self, fileName, targetName):
+        fileInfo = tarfile.TarInfo(fileName)
+        fileInfo.type = tarfile.LNKTYPE
+        fileInfo.linkname = targetName
+        self.archive.addfile(fileInfo)
+        return True
+
+    def close(self):
+        self.archive.close()
+
+# ZipSink: writes each recovered file into a zip file (stored, since most of the formats are already compressed)
+class ZipSink:
+    concurrent = False
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64 = True)
+
+    def extract(self, fileName, diskImage, offset, length, hasher = None):
+        with self.archive.open(fileName, 'w', force_zip64 = True) as outputFile:
+            for data in readRange(diskImage, offset, length):
+                if hasher is not None:
+                    hasher.update(data)
+                outputFile.write(data)
+
+    # link: zip files have no hard links, so the file is only recorded as a duplicate
+    def link(self, fileName, targetName):
+        return False
+
+    def close(self):
+        self.archive.close()
+
+# RangeReader: a read-only file object over a range of the disk image, so tarfile can copy a file straight from the image
+#              (the bytes are also passed through the hasher if there is one)
+class RangeReader:
+    def __init__(self, diskImage, offset, length, hasher = None):
+        self.diskImage = diskImage
+        self.position = offset
+        self.endOffset = offset + length
+        self.hasher = hasher
+
+    def read(self, size = -1):
+        if size < 0 or size > self.endOffset - self.position:
+            size = self.endOffset - self.position
+        data = self.diskImage.read(self.position, size)
+        self.position = self.position + len(data)
+        if self.hasher is not None:
+            self.hasher.update(data)
+        return data
+
+# NullSink: recovers nothing, only reading the files to hash them if there is a hasher (used to list what is on a disk)
+class NullSink:
+    concurrent = True
+
+    def extract(self, fileName, diskImage, offset, length, hasher = None):
+        if hasher is not None:
+            for data in readRange(diskImage, offset, length):
+                hasher.update(data)
+
+    def link(self, fileName, targetName):
+        return False
+
+    def close(self):
+        pass
+
+# openSink: creates the place the recovered files are written to (a directory, a tar file, or a zip file)
+def openSink(sinkType, outputPath):
+    if sinkType == 'tar':
+        return TarSink(outputPath or 'RecoveredFiles.tar')
+    if sinkType == 'zip':
+        return ZipSink(outputPath or 'RecoveredFiles.zip')
+    return DirectorySink(outputPath or '.')
+
+# DUPLICATE AND KNOWN FILES
+
+# Notes for filtering files: when duplicates are removed or known files are left out, each file is hashed before it is
+#                            written (a read the copy that follows gets from the page cache), so a file that is a copy
+#                            of one already recovered, or whose hash is in a reference list of known files (like the
+#                            NSRL), is recorded in the results and the manifest but never written. Duplicates can also
+#                            be hard linked to the copy that was written.
+
+# Hash used to tell whether two recovered files have the same contents
+DEDUP_ALGORITHM = 'sha256'
+
+# Hash algorithm of each length of hex digest found in a list of known file hashes
+KNOWN_HASH_LENGTHS = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+KNOWN_HASH = re.compile(r'(?<![0-9A-Fa-f])(?:[0-9A-Fa-f]{64}|[0-9A-Fa-f]{40}|[0-9A-Fa-f]{32})(?![0-9A-Fa-f])')
+
+# Extra manifest fields when files are filtered: the file this one is a copy of, and whether it is a known file
+FILTER_FIELDS = ['duplicateOf', 'knownFile']
+
+# KnownHashes: a reference list of the hashes of known files, kept as a sorted array of the first 8 bytes of every hash
+#              for each algorithm, so millions of hashes take 8 bytes each and are looked up with a binary search (two
+#              different files sharing the first 8 bytes of a hash is about as likely as a collision of a 64-bit hash)
+class KnownHashes:
+    def __init__(self):
+        self.prefixes = {}
+
+    # load: adds every MD5, SHA-1, and SHA-256 hash found in a text file (an NSRL style CSV, the output of sha256sum,
+    #       or one hash per line), telling them apart by their length, and returns how many were found
+    def load(self, path):
+        newPrefixes = {algorithm: array.array('Q') for algorithm in KNOWN_HASH_LENGTHS.values()}
+        numHashes = 0
+        with open(path, errors = 'replace') as hashFile:
+            for line in hashFile:
+                for digest in KNOWN_HASH.findall(line):
+                    newPrefixes[KNOWN_HASH_LENGTHS[len(digest)]].append(int(digest[:16], 16))
+                    numHashes = numHashes + 1
+        for algorithm, prefixes in newPrefixes.items():
+            if prefixes:
+                if algorithm in self.prefixes:
+                    prefixes.extend(self.prefixes[algorithm])
+                self.prefixes[algorithm] = self.sortPrefixes(prefixes)
+        return numHashes
+
+    # sortPrefixes: returns the hash prefixes sorted with the repeats removed
+    def sortPrefixes(self, prefixes):
+        if numpy is not None:
+            return numpy.unique(numpy.frombuffer(prefixes, dtype = numpy.uint64))
+        return array.array('Q', sorted(set(prefixes)))
+
+    # algorithms: returns the hash algorithms that files have to be hashed with to be checked against the list
+    def algorithms(self):
+        return set(self.prefixes)
+
+    # contains: returns True if any of the hex digests of a file are in the list
+    def contains(self, digests):
+        for algorithm, prefixes in self.prefixes.items():
+            if algorithm not in digests:
+                continue
+            prefix = int(digests[algorithm][:16], 16)
+            if numpy is not None and isinstance(prefixes, numpy.ndarray):
+                index = int(numpy.searchsorted(prefixes, numpy.uint64(prefix)))
+            else:
+                index = bisect.bisect_left(prefixes, prefix)
+            if index < len(prefixes) and int(prefixes[index]) == prefix:
+                return True
+        return False
+
+    # size: returns the number of hashes in the list
+    def size(self):
+        return sum(len(prefixes) for prefixes in self.prefixes.values())
+
+    # nbytes: returns the memory the list takes
+    def nbytes(self):
+        return 8 * self.size()
+
+# FileFilter: decides which recovered files are written, leaving out known files and (if dedup is 'once' or 'link')
+#             every file with the same contents as one already written, which with 'link' is hard linked to it. Files
+#             are hashed by several threads at once, so each file takes a ticket in file order when it is handed out and
+#             the files claim their contents in ticket order, which makes the first file with some contents the one
+#             that is written no matter which thread finishes hashing first
+class FileFilter:
+    def __init__(self, dedup = None, knownHashes = None):
+        self.dedup = dedup
+        self.knownHashes = knownHashes
+        # Hash of the contents of each file written, and the name it was written under along with an event that is set
+        # once it has been, so a duplicate recovered by another thread is not linked to a file that is not there yet
+        self.storedFiles = {}
+        self.lock = threading.Lock()
+        # The next ticket to hand out, and the ticket of the file whose turn it is to claim its contents
+        self.nextTicket = 0
+        self.claimTurn = 0
+        self.turn = threading.Condition(self.lock)
+
+    # algorithms: returns the hash algorithms that every file has to be hashed with before it can be checked
+    def algorithms(self):
+        algorithms = self.knownHashes.algorithms() if self.knownHashes is not None else set()
+        if self.dedup is not None:
+            algorithms.add(DEDUP_ALGORITHM)
+        return algorithms
+
+    # isKnown: returns True if the file's hashes are in the list of known files
+    def isKnown(self, digests):
+        return self.knownHashes is not None and self.knownHashes.contains(digests)
+
+    # reserve: returns the ticket of the next file in file order
+    def reserve(self):
+        with self.lock:
+            ticket = self.nextTicket
+            self.nextTicket = self.nextTicket + 1
+            return ticket
+
+    # claim: waits for the turn of the file with the given ticket (if it has one) and returns None if this is the first
+    #        file with these contents (which the caller then has to write, and call stored for), or the (name, event) of
+    #        the file that was written with them. A file that is not going to be written (digests is None) still has to
+    #        claim so the files after it get their turn
+    def claim(self, digests, fileName, ticket = None):
+        if self.dedup is None:
+            return None
+        with self.turn:
+            if ticket is not None:
+                self.turn.wait_for(lambda: self.claimTurn == ticket)
+                self.claimTurn = self.claimTurn + 1
+                self.turn.notify_all()
+            if digests is None:
+                return None
+            storedFile = self.storedFiles.get(digests[DEDUP_ALGORITHM])
+            if storedFile is None:
+                self.storedFiles[digests[DEDUP_ALGORITHM]] = (fileName, threading.Event())
+            return storedFile
+
+    # stored: marks the file with these contents as written (or as failed, so duplicates stop waiting for it)
+    def stored(self, digests):
+        if self.dedup is not None:
+            self.storedFiles[digests[DEDUP_ALGORITHM]][1].set()
+
+# loadKnownHashes: loads the lists of known file hashes at the given paths
+def loadKnownHashes(paths):
+    knownHashes = KnownHashes()
+    for path in paths:
+        numHashes = knownHashes.load(path)
+        print('Loaded ' + str(numHashes) + ' known file hashes from ' + path + '...')
+    return knownHashes
+
+# STRUCTURAL CARVERS
+
+# Notes for structural carvers: each carver walks through the file that starts at start using the lengths stored in
+#                               the file itself and returns the offset just past the end of the file, or -1 if the file
+#                               is damaged or does not end before the reader's limit (the largest size for its type)
+
+# A JPEG marker inside the compressed image data (0xff followed by anything except a stuffed zero or a restart marker)
+JPEG_MARKER = re.compile(rb'\xff[^\x00\xd0-\xd7]')
+
+# The startxref keyword and the offset of the cross reference table that come right before a PDF %%EOF
+PDF_STARTXREF = re.compile(rb'startxref\s+(\d+)\s*$')
+
+# The start of a PDF cross reference table or cross reference stream object
+PDF_XREF = re.compile(rb'xref|\d+\s+\d+\s+obj')
+
+# StructureReader: reads the fields that the structural carvers walk through, keeping a buffer of the disk image around
+#                  the current position so every field is not a separate read, and never reading past limit
+class StructureReader:
+    def __init__(self, diskImage, start, limit):
+        self.diskImage = diskImage
+        self.limit = min(limit, diskImage.size)
+        self.bufferStart = start
+        self.buffer = b''
+
+    # read: returns length bytes starting at offset (fewer if the limit is reached)
+    def read(self, offset, length):
+        length = min(length, self.limit - offset)
+        if length <= 0:
+            return b''
+        if offset < self.bufferStart or offset + length > self.bufferStart + len(self.buffer):
+            self.bufferStart = offset
+            self.buffer = self.diskImage.read(offset, min(max(length, STRUCTURE_BUFFER_SIZE), self.limit - offset))
+        return self.buffer[(offset - self.bufferStart):(offset - self.bufferStart + length)]
+
+    # search: returns the offset of the first match of the compiled pattern in [start, limit), or -1 if there is none
+    #         (matches are assumed to be at most maxLength bytes long)
+    def search(self, pattern, start, maxLength = 16):
+        position = start
+        while position < self.limit:
+            # Search the whole window (so a match that starts near its end is not cut short), but leave matches that
+            # start past STRUCTURE_BUFFER_SIZE to the next window
+            window = self.read(position, STRUCTURE_BUFFER_SIZE + maxLength)
+            match = pattern.search(window)
+            if match is not None and match.start() < STRUCTURE_BUFFER_SIZE:
+                return position + match.start()
+            position = position + STRUCTURE_BUFFER_SIZE
+        return -1
+
+    # find: returns the offset of the first occurrence of the bytes in [start, limit), or -1 if they are not there
+    def find(self, pattern, start):
+        return self.search(re.compile(re.escape(pattern)), start, len(pattern))
+
+# carvePng: walks the PNG chunks (length, type, data, and CRC) until the IEND chunk
+def carvePng(reader, start):
+    position = start + 8
+    while True:
+        chunkHeader = reader.read(position, 8)
+        if len(chunkHeader) < 8 or not chunkHeader[4:8].isalpha():
+            return -1
+        position = position + 12 + int.from_bytes(chunkHeader[0:4], 'big')
+        if chunkHeader[4:8] == b'IEND':
+            return position if position <= reader.limit else -1
+
+# carveJpg: walks the JPEG segment markers, skipping each segment by its length (so thumbnails inside the EXIF data
+#           are skipped too) and scanning the compressed image data after each start of scan for the next marker,
+#           until the end of image marker
+def carveJpg(reader, start):
+    position = start + 2
+    while True:
+        marker = reader.read(position, 4)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return -1
+        code = marker[1]
+        if code == 0xd9: # End of image
+            return position + 2
+        if code == 0xff: # Fill byte before a marker
+            position = position + 1
+        elif code == 0x01 or 0xd0 <= code <= 0xd7: # Markers without a length
+            position = position + 2
+        else:
+            if len(marker) < 4 or int.from_bytes(marker[2:4], 'big') < 2:
+                return -1
+            position = position + 2 + int.from_bytes(marker[2:4], 'big')
+            if code == 0xda: # Start of scan, the compressed image data runs until the next marker
+                position = reader.search(JPEG_MARKER, position, 2)
+                if position == -1:
+                    return -1
+
+# skipGifSubBlocks: skips a chain of GIF data sub-blocks (a size byte followed by that many bytes, ending with a
+#                   size of zero) and returns the offset after it
+def skipGifSubBlocks(reader, position):
+    while True:
+        blockSize = reader.read(position, 1)
+        if not blockSize:
+            return -1
+        position = position + 1 + blockSize[0]
+        if blockSize[0] == 0:
+            return position
+
+# carveGif: walks the GIF logical screen descriptor, color tables, extension blocks, and image blocks until the trailer
+def carveGif(reader, start):
+    header = reader.read(start, 13)
+    if len(header) < 13:
+        return -1
+    position = start + 13
+    if header[10] & 0x80: # Global color table
+        position = position + 3 * (2 << (header[10] & 0x07))
+
+    while position != -1:
+        block = reader.read(position, 1)
+        if block == b';': # Trailer
+            return position + 1
+        elif block == b'!': # Extension (introducer, label, then sub-blocks)
+            position = skipGifSubBlocks(reader, position + 2)
+        elif block == b',': # Image descriptor
+            descriptor = reader.read(position, 10)
+            if len(descriptor) < 10:
+                return -1
+            position = position + 10
+            if descriptor[9] & 0x80: # Local color table
+                position = position + 3 * (2 << (descriptor[9] & 0x07))
+            position = skipGifSubBlocks(reader, position + 1) # Skip the LZW minimum code size, then the image data
+        else:
+            return -1
+    return -1
+
+# carveZipFromEnd: finds the end of a zip file from its end of central directory record, checking that the central
+#                  directory it points to ends right where the record starts (used when the local headers cannot be
+#                  walked because their sizes are stored after the data)
+def carveZipFromEnd(reader, start):
+    position = reader.find(b'PK\x05\x06', start)
+    while position != -1:
+        record = reader.read(position, 22)
+        if len(record) < 22:
+            return -1
+        centralDirectorySize = int.from_bytes(record[12:16], 'little')
+        centralDirectoryOffset = int.from_bytes(record[16:20], 'little')
+        if start + centralDirectoryOffset + centralDirectorySize == position:
+            return position + 22 + int.from_bytes(record[20:22], 'little') # Add the length of the comment
+        position = reader.find(b'PK\x05\x06', position + 1)
+    return -1
+
+# carveZip: walks the zip local file headers and data, then the central directory, until the end of central directory
+#           record (DOCX files are zip files)
+def carveZip(reader, start):
+    position = start
+    while True:
+        header = reader.read(position, 46)
+        if header[0:4] == b'PK\x03\x04' and len(header) >= 30: # Local file header
+            flags = int.from_bytes(header[6:8], 'little')
+            compressedSize = int.from_bytes(header[18:22], 'little')
+            # If the sizes are only given after the data (or in a zip64 extra field) the data cannot be skipped
+            if (flags & 0x08 and compressedSize == 0) or compressedSize == 0xffffffff:
+                return carveZipFromEnd(reader, start)
+            position = position + 30 + int.from_bytes(header[26:28], 'little') + int.from_bytes(header[28:30], 'little') + compressedSize
+        elif header[0:4] == b'PK\x07\x08': # Data descriptor
+            position = position + 16
+        elif header[0:4] == b'PK\x01\x02' and len(header) >= 46: # Central directory file header
+            position = (position + 46 + int.from_bytes(header[28:30], 'little') + int.from_bytes(header[30:32], 'little') +
+                int.from_bytes(header[32:34], 'little'))
+        elif header[0:4] == b'PK\x06\x06' and len(header) >= 12: # Zip64 end of central directory record
+            position = position + 12 + int.from_bytes(header[4:12], 'little')
+        elif header[0:4] == b'PK\x06\x07': # Zip64 end of central directory locator
+            position = position + 20
+        elif header[0:4] == b'PK\x05\x06' and len(header) >= 22: # End of central directory record
+            position = position + 22 + int.from_bytes(header[20:22], 'little') # Add the length of the comment
+            return position if position <= reader.limit else -1
+        else:
+            return -1
+
+# carvePdf: finds the %%EOF markers whose startxref points at a cross reference table inside the file, and follows
+#           incremental updates (another body, cross reference table, and %%EOF appended to the file) until the last one
+def carvePdf(reader, start):
+    endOffset = -1
+    position = start
+    while True:
+        eof = reader.find(b'%%EOF', position)
+        if eof == -1:
+            return endOffset
+        position = eof + 5
+
+        # Check that startxref and the offset of a real cross reference table come right before the %%EOF
+        tailStart = max(start, eof - 32)
+        match = PDF_STARTXREF.search(reader.read(tailStart, eof - tailStart))
+        if match is None or start + int(match.group(1)) >= eof:
+            continue
+        if PDF_XREF.match(reader.read(start + int(match.group(1)), 32)) is None:
+            continue
+
+        # Include the end of line after the %%EOF
+        endOfLine = reader.read(position, 2)
+        if endOfLine == b'\r\n':
+            position = position + 2
+        elif endOfLine[0:1] in (b'\r', b'\n'):
+            position = position + 1
+        endOffset = position
+
+        # The file is over unless more PDF content (an incremental update) follows instead of free space
+        following = reader.read(position, 16).lstrip(b' \t\r\n')
+        if not following or following[0] == 0:
+            return endOffset
+
+# Notes for header carvers: a header carver works out where a file ends from the size stored in its header (checking
+#                           the rest of the header on the way), returning -1 if the header does not check out
+
+# carveBmp: a BMP file's size is the four bytes after the signature, and the four reserved bytes after them are zeros
+#           (the bmp signature is so short that the reserved bytes are what tells a real file from a false hit)
+def carveBmp(reader, start, maxSize):
+    header = reader.read(start, 10)
+    fileSize = int.from_bytes(header[2:6], 'little')
+    if header[6:10] == bytes(4) and 14 <= fileSize <= maxSize:
+        return start + fileSize
+    return -1
+
+# carveAvi: an AVI file is a RIFF file whose size (not counting the RIFF signature and the size itself) is the four
+#           bytes after the signature, followed by the rest of the AVI signature
+def carveAvi(reader, start, maxSize):
+    header = reader.read(start, 16)
+    fileSize = int.from_bytes(header[4:8], 'little') + 8
+    if header[8:16] == b'AVI LIST' and fileSize <= maxSize:
+        return start + fileSize
+    return -1
+
+# CARVER REGISTRY
+
+# Notes for the carver registry: how each type of file is carved is described by its entry in carvers, so a new type
+#                                only needs registerCarver with its signature, footers, and carving methods. A file is
+#                                carved by the first of these that works: its header carver ('header'), its structural
+#                                carver ('structure'), and then the first of its footers that follows it ('footer', plus
+#                                footerExtra bytes for footers that are only the start of the last record of the file)
+carvers = {}
+
+# registerCarver: adds (or replaces) the type of file sig with the given extension, ways of finding its end, and
+#                 largest size. A new signature (at most SECTOR_PREFIX bytes, so the sector index can match it) and new
+#                 footers are added to the ones the scan looks for
+def registerCarver(sig, extension, signature = None, footerPatterns = None, header = None, structure = None, footers = (),
+    footerExtra = 0, maxSize = None):
+    if signature is not None:
+        if not 0 < len(signature) <= SECTOR_PREFIX:
+            raise ValueError('Signatures must be 1 to ' + str(SECTOR_PREFIX) + ' bytes long')
+        signatures[sig] = signature
+    if sig not in signatures:
+        raise ValueError('No signature for ' + sig)
+    if footerPatterns is not None:
+        trailers.update(footerPatterns)
+    for footer in footers:
+        if footer not in trailers:
+            raise ValueError('No footer called ' + footer)
+    if maxSize is not None:
+        MAX_FILE_SIZES[sig] = maxSize
+    MAX_FILE_SIZES.setdefault(sig, STRUCTURE_BUFFER_SIZE)
+    carvers[sig] = {'extension': extension, 'header': header, 'structure': structure, 'footers': list(footers),
+        'footerExtra': footerExtra}
+
+# MPEG streams have no overall length, so only the footers that mark the end of the stream can be used
+registerCarver('MPG', 'mpg', footers = ['MPG1', 'MPG2'])
+# If the cross reference tables are damaged fall back on the first of the footers that mark the end of the file
+registerCarver('PDF', 'pdf', structure = carvePdf, footers = ['PDF1', 'PDF2', 'PDF3', 'PDF4'])
+registerCarver('BMP', 'bmp', header = carveBmp)
+registerCarver('GIF87a', 'gif', structure = carveGif, footers = ['GIF'])
+registerCarver('GIF89a', 'gif', structure = carveGif, footers = ['GIF'])
+registerCarver('JPG', 'jpg', structure = carveJpg, footers = ['JPG'])
+# The footer is the start of the end of central directory record, add the other 18 bytes of the record
+registerCarver('DOCX', 'docx', structure = carveZip, footers = ['DOCX'], footerExtra = 18)
+registerCarver('AVI', 'avi', header = carveAvi)
+registerCarver('PNG', 'png', structure = carvePng, footers = ['PNG'])
+
+# MANIFESTS
+
+# Notes for manifests: a manifest has one record per file with the fields below, plus one field for each hash, written
+#                      as JSON lines or CSV. A manifest (or a filtered copy of one) can be given to --extract to recover
+#                      just the files in it
+
+# Fields of a manifest record (all of the offsets and sizes are in bytes)
+MANIFEST_FIELDS = ['fileName', 'type', 'startOffset', 'endOffset', 'size', 'status']
+
+# ManifestWriter: writes one manifest record per file, through a buffer so a record is not a separate write
+#                 (with filterFields, each record also says which file it is a copy of and whether it is a known file)
+class ManifestWriter:
+    def __init__(self, path, manifestFormat = None, algorithms = (), filterFields = False):
+        # Work out the format from the file name if it is not given
+        if manifestFormat is None:
+            manifestFormat = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        self.manifestFormat = manifestFormat
+        self.extraFields = FILTER_FIELDS if filterFields else []
+        self.fields = MANIFEST_FIELDS + self.extraFields + list(algorithms)
+        if path == '-':
+            self.file = sys.stdout
+            self.closeFile = False
+        else:
+            self.file = open(path, 'w', newline = '', buffering = MANIFEST_BUFFER_SIZE)
+            self.closeFile = True
+        if manifestFormat == 'csv':
+            self.writer = csv.DictWriter(self.file, self.fields, extrasaction = 'ignore')
+            self.writer.writeheader()
+
+    def write(self, result):
+        record = {field: result[field] for field in MANIFEST_FIELDS}
+        for field in self.extraFields:
+            record[field] = result.get(field)
+        record.update(result['digests'])
+        if self.manifestFormat == 'csv':
+            self.writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self.closeFile:
+            self.file.close()
+        else:
+            self.file.flush()
+
+# readManifest: reads the records of a JSON lines or CSV manifest as results that can be recovered
+def readManifest(path):
+    with open(path, newline = '') as manifestFile:
+        if path.lower().endswith('.csv'):
+            records = list(csv.DictReader(manifestFile))
+        else:
+            records = [json.loads(line) for line in manifestFile if line.strip()]
+
+    results = []
+    for record in records:
+        result = {field: record.get(field) for field in MANIFEST_FIELDS}
+        for field in ('startOffset', 'endOffset', 'size'):
+            result[field] = int(result[field])
+        result['digests'] = {}
+        results.append(result)
+    return results
+
+# FILE SYSTEMS
+
+# Notes for file systems: when only unallocated space is carved, the partition table (MBR, with extended partitions,
+#                         or GPT) is read to find the volumes on the disk, and the FAT of each FAT12/16/32 volume or the
+#                         $Bitmap of each NTFS volume gives the clusters no file is using. Space outside every volume,
+#                         and volumes whose file system is not recognized, count as unallocated so nothing is missed
+
+# Size of the logical blocks partition tables count in. This is 512 bytes whatever --sector-size says (that is the size
+# of the units files are laid out in), except on a GPT disk that was formatted with 4096-byte blocks, which is told
+# apart by where its GPT header is
+LBA_SIZE = 512
+GPT_LBA_SIZES = (512, 4096)
+
+# MBR partition types that hold more partitions (extended partitions), and the type that means the disk uses a GPT
+EXTENDED_PARTITION_TYPES = (0x05, 0x0f, 0x85)
+GPT_PROTECTIVE_TYPE = 0xee
+
+# Most logical partitions followed in an extended partition, and most GPT entries read, so a damaged table cannot make
+# the program loop forever or read the whole disk
+MAX_LOGICAL_PARTITIONS = 128
+MAX_GPT_ENTRIES = 1024
+
+# NTFS keeps the cluster allocation bitmap in the $DATA attribute of MFT record 6 ($Bitmap)
+NTFS_BITMAP_RECORD = 6
+NTFS_DATA_ATTRIBUTE = 0x80
+
+# NTFS protects every 512 bytes of an MFT record with the update sequence number, whatever the volume's sector size
+NTFS_FIXUP_STRIDE = 512
+
+# readGptPartitions: returns the (start, end) byte ranges of the partitions in a GUID partition table (whose header is in
+#                    the second logical block, which also gives the size of the blocks)
+def readGptPartitions(diskImage):
+    for lbaSize in GPT_LBA_SIZES:
+        header = diskImage.read(lbaSize, 92)
+        if header[0:8] == b'EFI PART':
+            break
+    else:
+        return []
+    entriesStart = int.from_bytes(header[72:80], 'little') * lbaSize
+    numEntries = min(int.from_bytes(header[80:84], 'little'), MAX_GPT_ENTRIES)
+    entrySize = int.from_bytes(header[84:88], 'little')
+    if entrySize < 48:
+        return []
+    entries = diskImage.read(entriesStart, numEntries * entrySize)
+
+    partitions = []
+    for position in range(0, len(entries) - entrySize + 1, entrySize):
+        entry = entries[position:(position + entrySize)]
+        # An entry with no partition type is not in use
+        if entry[0:16] == bytes(16):
+            continue
+        firstLba = int.from_bytes(entry[32:40], 'little')
+        lastLba = int.from_bytes(entry[40:48], 'little')
+        partitions.append((firstLba * lbaSize, (lastLba + 1) * lbaSize))
+    return partitions
+
+# readLogicalPartitions: follows the chain of extended boot records in an extended partition and returns the (start, end)
+#                        byte ranges of the logical partitions in it
+def readLogicalPartitions(diskImage, extendedStart):
+    partitions = []
+    recordStart = extendedStart
+    for _ in range(MAX_LOGICAL_PARTITIONS):
+        record = diskImage.read(recordStart * LBA_SIZE, 512)
+        if len(record) < 512 or record[510:512] != b'\x55\xaa':
+            break
+        # The first entry is the logical partition (relative to this record), the second points at the next record
+        # (relative to the start of the extended partition)
+        start = int.from_bytes(record[454:458], 'little')
+        count = int.from_bytes(record[458:462], 'little')
+        if record[450] != 0 and count > 0:
+            partitions.append(((recordStart + start) * LBA_SIZE, (recordStart + start + count) * LBA_SIZE))
+        nextRecord = int.from_bytes(record[470:474], 'little')
+        if record[466] not in EXTENDED_PARTITION_TYPES or nextRecord == 0:
+            break
+        recordStart = extendedStart + nextRecord
+    return partitions
+
+# readPartitions: returns the (start, end) byte ranges of the partitions in the MBR (or GPT) of the disk, or an empty list
+#                 if the disk has no partition table
+def readPartitions(diskImage):
+    mbr = diskImage.read(0, 512)
+    if len(mbr) < 512 or mbr[510:512] != b'\x55\xaa':
+        return []
+    partitions = []
+    for position in range(446, 510, 16):
+        partitionType = mbr[position + 4]
+        start = int.from_bytes(mbr[(position + 8):(position + 12)], 'little')
+        count = int.from_bytes(mbr[(position + 12):(position + 16)], 'little')
+        if partitionType == 0 or count == 0:
+            continue
+        if partitionType == GPT_PROTECTIVE_TYPE:
+            return readGptPartitions(diskImage)
+        if partitionType in EXTENDED_PARTITION_TYPES:
+            partitions.extend(readLogicalPartitions(diskImage, start))
+        else:
+            partitions.append((start * LBA_SIZE, (start + count) * LBA_SIZE))
+    return partitions
+
+# findRuns: returns the (start, end) index ranges of the runs of 1s in a bytes object of 0s and 1s
+def findRuns(flags):
+    runs = []
+    start = flags.find(1)
+    while start != -1:
+        end = flags.find(0, start)
+        if end == -1:
+            end = len(flags)
+        runs.append((start, end))
+        start = flags.find(1, end)
+    return runs
+
+# fatFreeFlags: returns one byte for each cluster of a FAT volume (starting at cluster 2), 1 if the cluster is free and 0
+#               if it is in use. Clusters past the end of a truncated FAT count as free
+def fatFreeFlags(fat, fatType, numClusters):
+    if fatType == 12:
+        # FAT12 entries are 12 bits, packed two to every three bytes
+        flags = bytearray()
+        for cluster in range(2, numClusters + 2):
+            position = cluster * 3 // 2
+            if position + 2 > len(fat):
+                break
+            entry = int.from_bytes(fat[position:(position + 2)], 'little')
+            entry = entry >> 4 if cluster & 1 else entry & 0xfff
+            flags.append(1 if entry == 0 else 0)
+    elif numpy is not None:
+        entries = numpy.frombuffer(fat, '<u2' if fatType == 16 else '<u4', len(fat) // (fatType // 8))[2:(numClusters + 2)]
+        if fatType == 32:
+            entries = entries & 0x0fffffff # The top 4 bits of a FAT32 entry are reserved
+        flags = bytearray((entries == 0).astype(numpy.uint8).tobytes())
+    else:
+        entries = array.array('H' if fatType == 16 else 'I')
+        entries.frombytes(fat[:(len(fat) - len(fat) % entries.itemsize)])
+        if sys.byteorder == 'big':
+            entries.byteswap()
+        mask = 0xffff if fatType == 16 else 0x0fffffff
+        flags = bytearray(1 if entry & mask == 0 else 0 for entry in entries[2:(numClusters + 2)])
+    return bytes(flags) + b'\x01' * (numClusters - len(flags))
+
+# readFatVolume: reads the FAT of a FAT12/16/32 volume and returns its name, the (start, end) byte ranges of its free
+#                clusters, and its size in bytes (or None if the boot sector does not check out)
+def readFatVolume(diskImage, start, bootSector):
+    bytesPerSector = int.from_bytes(bootSector[11:13], 'little')
+    sectorsPerCluster = bootSector[13]
+    reservedSectors = int.from_bytes(bootSector[14:16], 'little')
+    numFats = bootSector[16]
+    rootEntries = int.from_bytes(bootSector[17:19], 'little')
+    totalSectors = int.from_bytes(bootSector[19:21], 'little') or int.from_bytes(bootSector[32:36], 'little')
+    fatSize = int.from_bytes(bootSector[22:24], 'little') or int.from_bytes(bootSector[36:40], 'little')
+    if (bytesPerSector not in (512, 1024, 2048, 4096) or sectorsPerCluster == 0 or sectorsPerCluster & (sectorsPerCluster - 1)
+        or reservedSectors == 0 or numFats not in (1, 2) or fatSize == 0 or totalSectors == 0):
+        return None
+
+    # The data area comes after the reserved sectors, the FATs, and the root directory (FAT12/16 only)
+    rootDirectorySectors = (rootEntries * 32 + bytesPerSector - 1) // bytesPerSector
+    firstDataSector = reservedSectors + numFats * fatSize + rootDirectorySectors
+    if firstDataSector >= totalSectors:
+        return None
+    numClusters = (totalSectors - firstDataSector) // sectorsPerCluster
+    # The FAT type is decided by the number of clusters, not by the label in the boot sector
+    fatType = 12 if numClusters < 4085 else 16 if numClusters < 65525 else 32
+
+    fat = diskImage.read(start + reservedSectors * bytesPerSector, fatSize * bytesPerSector)
+    clusterSize = sectorsPerCluster * bytesPerSector
+    dataStart = start + firstDataSector * bytesPerSector
+    extents = [(dataStart + runStart * clusterSize, dataStart + runEnd * clusterSize)
+        for runStart, runEnd in findRuns(fatFreeFlags(fat, fatType, numClusters))]
+    # Sectors after the last whole cluster are not used by the file system either
+    volumeSize = totalSectors * bytesPerSector
+    extents.append((dataStart + numClusters * clusterSize, start + volumeSize))
+    return 'FAT' + str(fatType), extents, volumeSize
+
+# parseDataRuns: returns the (first cluster, number of clusters) runs of a non-resident NTFS attribute, where the first
+#                cluster is None for a sparse run
+def parseDataRuns(record, position, end):
+    runs = []
+    cluster = 0
+    while position < end and record[position] != 0:
+        lengthSize = record[position] & 0x0f
+        offsetSize = record[position] >> 4
+        length = int.from_bytes(record[(position + 1):(position + 1 + lengthSize)], 'little')
+        if offsetSize == 0:
+            runs.append((None, length))
+        else:
+            # Each run starts at an offset from the start of the run before it
+            cluster = cluster + int.from_bytes(record[(position + 1 + lengthSize):(position + 1 + lengthSize + offsetSize)],
+                'little', signed = True)
+            runs.append((cluster, length))
+        position = position + 1 + lengthSize + offsetSize
+    return runs
+
+# readNtfsVolume: reads the $Bitmap of an NTFS volume and returns its name, the (start, end) byte ranges of its free
+#                 clusters, and its size in bytes (or None if the boot sector or $Bitmap record does not check out)
+def readNtfsVolume(diskImage, start, bootSector):
+    bytesPerSector = int.from_bytes(bootSector[11:13], 'little')
+    sectorsPerCluster = bootSector[13]
+    # Large clusters are stored as a negative power of two
+    if sectorsPerCluster > 128:
+        sectorsPerCluster = 1 << (256 - sectorsPerCluster)
+    totalSectors = int.from_bytes(bootSector[40:48], 'little')
+    mftCluster = int.from_bytes(bootSector[48:56], 'little')
+    recordSize = int.from_bytes(bootSector[64:65], 'little', signed = True)
+    if bytesPerSector not in (512, 1024, 2048, 4096) or sectorsPerCluster == 0 or totalSectors == 0:
+        return None
+    clusterSize = sectorsPerCluster * bytesPerSector
+    # A negative record size is a power of two in bytes, a positive one is a number of clusters
+    recordSize = 1 << -recordSize if recordSize < 0 else recordSize * clusterSize
+
+    record = bytearray(diskImage.read(start + mftCluster * clusterSize + NTFS_BITMAP_RECORD * recordSize, recordSize))
+    if len(record) < recordSize or record[0:4] != b'FILE':
+        return None
+    # Put back the last two bytes of every 512-byte stride, which were swapped for the update sequence number when it
+    # was written
+    updateSequence = int.from_bytes(record[4:6], 'little')
+    for sector in range(1, int.from_bytes(record[6:8], 'little')):
+        position = sector * NTFS_FIXUP_STRIDE - 2
+        if position + 2 > len(record) or record[position:(position + 2)] != record[updateSequence:(updateSequence + 2)]:
+            return None
+        record[position:(position + 2)] = record[(updateSequence + 2 * sector):(updateSequence + 2 * sector + 2)]
+
+    # Find the unnamed, non-resident $DATA attribute, which holds the bitmap
+    runs = None
+    bitmapSize = 0
+    position = int.from_bytes(record[20:22], 'little')
+    while position + 16 <= len(record):
+        attributeType = int.from_bytes(record[position:(position + 4)], 'little')
+        attributeLength = int.from_bytes(record[(position + 4):(position + 8)], 'little')
+        if attributeType == 0xffffffff or attributeLength == 0:
+            break
+        if attributeType == NTFS_DATA_ATTRIBUTE and record[position + 8] == 1 and record[position + 9] == 0:
+            runs = parseDataRuns(record, position + int.from_bytes(record[(position + 32):(position + 34)], 'little'),
+                position + attributeLength)
+            bitmapSize = int.from_bytes(record[(position + 48):(position + 56)], 'little')
+            break
+        position = position + attributeLength
+    if runs is None:
+        return None
+    bitmap = b''.join(bytes(length * clusterSize) if cluster is None else diskImage.read(start + cluster * clusterSize,
+        length * clusterSize) for cluster, length in runs)[:bitmapSize]
+
+    # Bit n of the bitmap (starting from the lowest bit of each byte) is set if cluster n is in use
+    numClusters = totalSectors // sectorsPerCluster
+    if numpy is not None:
+        used = numpy.unpackbits(numpy.frombuffer(bitmap, numpy.uint8), bitorder = 'little')[:numClusters]
+        flags = (1 - used).astype(numpy.uint8).tobytes()
+    else:
+        freeBits = [bytes(1 - ((value >> bit) & 1) for bit in range(8)) for value in range(256)]
+        flags = b''.join(freeBits[value] for value in bitmap)[:numClusters]
+    flags = flags + b'\x01' * (numClusters - len(flags))
+    extents = [(start + runStart * clusterSize, start + runEnd * clusterSize) for runStart, runEnd in findRuns(flags)]
+    # The backup boot sector sits after the last whole cluster
+    volumeSize = totalSectors * bytesPerSector
+    extents.append((start + numClusters * clusterSize, start + volumeSize))
+    return 'NTFS', extents, volumeSize
+
+# readVolume: reads the file system of the volume that starts at start, returning its name, the (start, end) byte ranges
+#             of its free clusters, and its size, or None if the file system is not one that is understood
+def readVolume(diskImage, start):
+    bootSector = diskImage.read(start, 512)
+    if len(bootSector) < 512 or bootSector[510:512] != b'\x55\xaa':
+        return None
+    if bootSector[3:11] == b'NTFS    ':
+        return readNtfsVolume(diskImage, start, bootSector)
+    # A FAT boot sector starts with a jump over the BIOS parameter block
+    if bootSector[0] == 0xeb or bootSector[0] == 0xe9:
+        return readFatVolume(diskImage, start, bootSector)
+    return None
+
+# mergeExtents: sorts (start, end) byte ranges, keeps them inside [0, size), and joins the ones that touch or overlap
+def mergeExtents(extents, size):
+    merged = []
+    for start, end in sorted(extents):
+        start = max(0, start)
+        end = min(end, size)
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+# invertExtents: returns the (start, end) byte ranges of [0, size) that are not in the given sorted, merged extents
+def invertExtents(extents, size):
+    gaps = []
+    position = 0
+    for start, end in extents:
+        if start > position:
+            gaps.append((position, start))
+        position = end
+    if position < size:
+        gaps.append((position, size))
+    return gaps
+
+# intersectExtents: returns the (start, end) byte ranges that are in both of the given lists of sorted extents
+def intersectExtents(extents, otherExtents):
+    intersection = []
+    index = 0
+    for start, end in extents:
+        while index < len(otherExtents) and otherExtents[index][1] <= start:
+            index = index + 1
+        otherIndex = index
+        while otherIndex < len(otherExtents) and otherExtents[otherIndex][0] < end:
+            otherStart, otherEnd = otherExtents[otherIndex]
+            intersection.append((max(start, otherStart), min(end, otherEnd)))
+            otherIndex = otherIndex + 1
+    return intersection
+
+# findUnallocatedExtents: returns the (start, end) byte ranges of the disk that no file system is using (free clusters,
+#                         space outside every partition, and partitions whose file system is not recognized) and a
+#                         (start, name, size, unallocated bytes) description of every volume
+def findUnallocatedExtents(diskImage):
+    # The image can be a single volume with no partition table
+    if readVolume(diskImage, 0) is not None:
+        partitions = [(0, diskImage.size)]
+    else:
+        partitions = mergeExtents(readPartitions(diskImage), diskImage.size)
+    extents = invertExtents(partitions, diskImage.size)
+
+    volumes = []
+    for start, end in partitions:
+        volume = readVolume(diskImage, start)
+        if volume is None:
+            volumeExtents = [(start, end)]
+            volumes.append((start, 'unknown', end - start, end - start))
+        else:
+            name, volumeExtents, volumeSize = volume
+            # Anything in the partition past the end of the file system is unallocated too
+            volumeExtents = mergeExtents(volumeExtents + [(start + volumeSize, end)], end)
+            volumes.append((start, name, end - start, sum(extentEnd - extentStart for extentStart, extentEnd in volumeExtents)))
+        extents.extend(volumeExtents)
+    return mergeExtents(extents, diskImage.size), volumes
+
+# INSTRUMENTATION
+
+# Profile: keeps the wall time and bytes of each stage of the recovery (opening the disk image, scanning it, carving
+#          the files, extracting them, and hashing them), counts what happened to the headers of each type, and draws
+#          the live progress line. The extract and hash stages are added to by the recovery threads, so their times
+#          are the total over all of the threads. It also keeps the ranges of the disk that were skipped without being
+#          searched (holes in a sparse image and blocks that are all zeros or one fill byte), so the scan can be audited
+class Profile:
+    def __init__(self, showProgress = False):
+        self.startTime = time.perf_counter()
+        self.stages = {}
+        self.signatures = {sig: dict(dict.fromkeys(SIGNATURE_COUNTERS, 0), carveSeconds = 0.0) for sig in signatures}
+        self.skipped = []
+        # Files that were found but not written, and their bytes, for each reason (duplicate or known)
+        self.filtered = {}
+        self.showProgress = showProgress
+        self.progressLength = 0
+        self.lastProgress = 0.0
+        self.lock = threading.Lock()
+
+    # addStage: adds the time (in seconds) and bytes of one piece of work to a stage
+    def addStage(self, name, seconds, numBytes = 0):
+        with self.lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'bytes': 0, 'calls': 0})
+            stage['seconds'] = stage['seconds'] + seconds
+            stage['bytes'] = stage['bytes'] + numBytes
+            stage['calls'] = stage['calls'] + 1
+
+    # stage: adds the time the code in a with block takes to a stage
+    @contextlib.contextmanager
+    def stage(self, name, numBytes = 0):
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addStage(name, time.perf_counter() - startTime, numBytes)
+
+    # addSkipped: adds (start, end, reason) ranges of the disk that were not searched, joining them to the last range
+    #             if they touch it and were skipped for the same reason
+    def addSkipped(self, ranges):
+        for start, end, reason in ranges:
+            if self.skipped and self.skipped[-1][1] == start and self.skipped[-1][2] == reason:
+                self.skipped[-1] = (self.skipped[-1][0], end, reason)
+            else:
+                self.skipped.append((start, end, reason))
+
+    # addFiltered: counts a file of numBytes bytes that was not written for the given reason
+    def addFiltered(self, reason, numBytes):
+        with self.lock:
+            filtered = self.filtered.setdefault(reason, {'files': 0, 'bytes': 0})
+            filtered['files'] = filtered['files'] + 1
+            filtered['bytes'] = filtered['bytes'] + numBytes
+
+    # skippedBytes: returns the number of bytes skipped for each reason
+    def skippedBytes(self):
+        totals = {}
+        for start, end, reason in self.skipped:
+            totals[reason] = totals.get(reason, 0) + end - start
+        return totals
+
+    # count: adds one to a counter of a signature
+    def count(self, sig, counter):
+        self.signatures[sig][counter] = self.signatures[sig][counter] + 1
+
+    # progress: redraws the progress line (on standard error) with how far the scan has got, how fast it is going, and
+    #           about how long it has left
+    def progress(self, offset, total):
+        now = time.perf_counter()
+        if not self.showProgress or (now - self.lastProgress < PROGRESS_INTERVAL and offset < total):
+            return
+        self.lastProgress = now
+        scan = self.stages.get('scan', {'seconds': 0.0, 'bytes': 0})
+        rate = scan['bytes'] / scan['seconds'] if scan['seconds'] > 0 else 0.0
+        line = ('Scanned ' + str(hex(offset)) + ' of ' + str(hex(total)) + ' (' + str(round(100 * offset / total, 1) if total else 100.0) +
+            '%), ' + str(round(rate / (1024 * 1024), 1)) + ' MiB/s, ETA ' +
+            (str(round((total - offset) / rate)) + 's' if rate > 0 else '?'))
+        sys.stderr.write('\r' + line.ljust(self.progressLength))
+        sys.stderr.flush()
+        self.progressLength = len(line)
+
+    # clearProgress: removes the progress line so other messages can be printed
+    def clearProgress(self):
+        if self.progressLength:
+            sys.stderr.write('\r' + ' ' * self.progressLength + '\r')
+            sys.stderr.flush()
+            self.progressLength = 0
+
+    # report: returns everything that was measured as a dictionary that can be saved as JSON
+    def report(self, diskImage = None):
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage, seconds = round(stage['seconds'], 6),
+                MiBPerSecond = round(stage['bytes'] / (1024 * 1024) / stage['seconds'], 2) if stage['bytes'] and stage['seconds'] > 0 else None)
+        signatureCounts = {sig: dict(counts, carveSeconds = round(counts['carveSeconds'], 6))
+            for sig, counts in self.signatures.items()}
+        return {'image': diskImage.path if diskImage is not None else None,
+            'imageSize': diskImage.size if diskImage is not None else None,
+            'totalSeconds': round(time.perf_counter() - self.startTime, 6), 'stages': stages, 'signatures': signatureCounts,
+            'filtered': self.filtered, 'skippedBytes': self.skippedBytes(),
+            'skipped': [{'start': start, 'end': end, 'reason': reason} for start, end, reason in sorted(self.skipped)]}
+
+# printProfile: prints the time and speed of each stage and the counts for each type of header
+def printProfile(profile):
+    print('\nStage timings:')
+    for name, stage in profile.stages.items():
+        rate = ''
+        if stage['bytes'] and stage['seconds'] > 0:
+            rate = ', ' + str(round(stage['bytes'] / (1024 * 1024) / stage['seconds'], 1)) + ' MiB/s'
+        print('    ' + name + ': ' + str(round(stage['seconds'], 3)) + ' seconds, ' + str(stage['bytes']) + ' bytes' + rate)
+    skippedBytes = profile.skippedBytes()
+    if skippedBytes:
+        print('Skipped without searching (' + str(len(profile.skipped)) + ' ranges):')
+        for reason, numBytes in sorted(skippedBytes.items()):
+            print('    ' + reason + ': ' + str(numBytes) + ' bytes')
+    if profile.filtered:
+        print('Files not written:')
+        for reason, filtered in sorted(profile.filtered.items()):
+            print('    ' + reason + ': ' + str(filtered['files']) + ' files, ' + str(filtered['bytes']) + ' bytes')
+    # When the files come from a manifest there was no scan, so there are no headers to count
+    if not any(counts['raw'] for counts in profile.signatures.values()):
+        return
+    print('Headers found (raw / not sector aligned / inside another file / rejected / recovered):')
+    for sig, counts in profile.signatures.items():
+        if counts['raw']:
+            print('    ' + sig + ': ' + ' / '.join(str(counts[counter]) for counter in SIGNATURE_COUNTERS))
+
+# saveProfile: writes the profile report to a JSON file
+def saveProfile(profilePath, profile, diskImage):
+    with open(profilePath, 'w') as profileFile:
+        json.dump(profile.report(diskImage), profileFile, indent = 2)
+    print('Profile saved to ' + profilePath + '...')
+
+# CARVING API
+
+# Notes for the carving API: other programs can import this file and carve disk images without the command line and
+#                            without anything being printed, for example
+#                                with DiskCarver('Project2.dd', types = ['JPG', 'PNG']) as carver:
+#                                    for carvedFile in carver:
+#                                        makeThumbnail(carver.read(carvedFile))
+#                            or async for carvedFile in carver from asyncio code. Each file is handed out as soon as it
+#                            is found, in offset order, while the rest of the disk is still being scanned (with
+#                            unallocated='first' the unallocated space comes first, and then the rest of the disk)
+
+# Number of files the scan can get ahead of an async for loop before it waits for the loop to catch up
+ASYNC_QUEUE_SIZE = 64
+
+# How often (in seconds) the scan thread of an async for loop checks whether it has been told to stop while it waits for
+# the loop to take a file
+ASYNC_STOP_CHECK = 0.1
+
+# CarvedFile: a file found on the disk image, with its fields kept in slots so a consumer holding on to millions of
+#             them does not pay for a dictionary each
+class CarvedFile:
+    __slots__ = ('fileName', 'type', 'extension', 'startOffset', 'endOffset', 'size', 'status')
+
+    def __init__(self, fileName, fileType, startOffset, endOffset, size, status):
+        self.fileName = fileName
+        self.type = fileType
+        self.extension = carvers[fileType]['extension']
+        self.startOffset = startOffset
+        self.endOffset = endOffset
+        self.size = size
+        self.status = status
+
+    # fromResult: makes a CarvedFile from a result of carveFiles
+    @classmethod
+    def fromResult(cls, result):
+        return cls(result['fileName'], result['type'], result['startOffset'], result['endOffset'], result['size'],
+            result['status'])
+
+    # asResult: returns the file as a result dictionary (the same fields as a manifest record), which is what the rest
+    #           of the program recovers files from
+    def asResult(self):
+        return {'fileName': self.fileName, 'type': self.type, 'startOffset': self.startOffset,
+            'endOffset': self.endOffset, 'size': self.size, 'status': self.status, 'digests': {}}
+
+    def __repr__(self):
+        return ('CarvedFile(' + self.fileName + ', ' + self.type + ', ' + str(hex(self.startOffset)) + '-' +
+            str(hex(self.endOffset)) + ', ' + self.status + ')')
+
+# DiskCarver: opens a disk image and carves the files on it, handing each one out as a CarvedFile as soon as it is found.
+#             The options are the same as the command line's (maxSizes only needs the types whose largest size changes)
+class DiskCarver:
+    def __init__(self, inputDisk, scanMode = 'mmap', chunkSize = CHUNK_SIZE, cacheSize = BLOCK_CACHE_SIZE,
+        sectorSize = SECTOR_SIZE, sectorIndex = False, jobs = 1, maxSizes = None, types = None, unallocated = None):
+        self.diskImage = createDiskImage(inputDisk, scanMode, chunkSize, cacheSize)
+        self.sectorSize = sectorSize
+        self.sectorIndex = sectorIndex
+        # Worker processes open the disk image again, which would mean decompressing all of a compressed image again
+        self.jobs = jobs if self.diskImage.source.reopenable else 1
+        self.maxSizes = dict(MAX_FILE_SIZES)
+        self.maxSizes.update(maxSizes or {})
+        self.types = set(types) if types is not None else None
+        self.unallocated = unallocated
+        # Timings, header counts, and skipped ranges of the last carve, like the command line's --profile
+        self.profile = Profile()
+        # The thread scanning for an async for loop, and the event that tells it to stop (so close can wait for it to
+        # finish before the disk image goes away)
+        self.scanThread = None
+        self.scanStop = None
+
+    # files: scans the disk image and yields a CarvedFile for every file found (of the types asked for, which are still
+    #        numbered the same way as when every type is carved). If a stop event is given, the scan ends early once
+    #        it is set
+    def files(self, stop = None):
+        self.profile = Profile()
+        scanPasses, holes, volumes = planScan(self.diskImage, self.sectorSize, self.unallocated, self.profile)
+        hitList = HitList()
+        numFilesFound = 0
+        for passNumber, regions in enumerate(scanPasses):
+            hitBatches = streamHits(self.diskImage, self.sectorSize if self.sectorIndex else None, self.jobs, regions, stop)
+            if stop is not None:
+                hitBatches = itertools.takewhile(lambda batch: not stop.is_set(), hitBatches)
+            for result in carveFiles(self.diskImage, hitBatches, self.sectorSize, self.maxSizes, hitList, self.profile,
+                numFilesFound, passNumber == len(scanPasses) - 1):
+                if stop is not None and stop.is_set():
+                    return
+                numFilesFound = numFilesFound + 1
+                if self.types is None or result['type'] in self.types:
+                    yield CarvedFile.fromResult(result)
+
+    def __iter__(self):
+        return self.files()
+
+    # __aiter__: lets asyncio code go through the files with async for. The scan runs on its own thread and can get up
+    #            to ASYNC_QUEUE_SIZE files ahead, so the event loop is never blocked by it
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(ASYNC_QUEUE_SIZE)
+        stop = threading.Event()
+
+        # Put an item in the queue from the scan thread, waiting while the queue is full, and return False if the loop
+        # stopped (or went away) before it was taken in
+        def handOver(item):
+            try:
+                future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            except RuntimeError:
+                return False
+            while not stop.is_set():
+                try:
+                    future.result(ASYNC_STOP_CHECK)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    continue
+                except concurrent.futures.CancelledError:
+                    return False
+            future.cancel()
+            return False
+
+        # Hand every file to the event loop, then None at the end, or the error that stopped the scan
+        def scanFiles():
+            try:
+                for carvedFile in self.files(stop):
+                    if not handOver(carvedFile):
+                        return
+                last = None
+            except Exception as error:
+                last = error
+            handOver(last)
+
+        scanThread = threading.Thread(target = scanFiles, daemon = True)
+        self.scanThread = scanThread
+        self.scanStop = stop
+        scanThread.start()
+        try:
+            while True:
+                carvedFile = await queue.get()
+                if isinstance(carvedFile, Exception):
+                    raise carvedFile
+                if carvedFile is None:
+                    break
+                yield carvedFile
+        finally:
+            # If the loop stopped early, let the scan put its last file in the queue and notice it has to stop
+            stop.set()
+            while not queue.empty():
+                queue.get_nowait()
+            await loop.run_in_executor(None, scanThread.join)
+
+    # read: returns the contents of a carved file
+    def read(self, carvedFile):
+        return b''.join(readRange(self.diskImage, carvedFile.startOffset, carvedFile.size))
+
+    # chunks: yields the contents of a carved file a buffer at a time, so a large file does not have to fit in memory
+    def chunks(self, carvedFile):
+        return readRange(self.diskImage, carvedFile.startOffset, carvedFile.size)
+
+    # extract: recovers a carved file into a sink (see openSink) and returns its hashes
+    def extract(self, carvedFile, sink, algorithms = HASH_ALGORITHMS):
+        return recoverFile(self.diskImage, sink, carvedFile.asResult(), algorithms)['digests']
+
+    # close: stops the scan of an async for loop that was left early (and waits for it) before closing the disk image
+    def close(self):
+        if self.scanThread is not None:
+            self.scanStop.set()
+            self.scanThread.join()
+            self.scanThread = None
+        self.diskImage.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+# carveDiskImage: opens a disk image and yields a CarvedFile for every file on it as soon as it is found, closing the
+#                 image at the end (takes the same options as DiskCarver)
+def carveDiskImage(inputDisk, **options):
+    with DiskCarver(inputDisk, **options) as carver:
+        yield from carver
+
+# BATCH MODE
+
+# Notes for the batch mode: when several disk images (or a directory of them) are given, each image is recovered by its
+#                           own process into its own directory (files, manifest, profile, and log), and the images are
+#                           started only while the number running and the memory they are expected to use stay within
+#                           the limits, so a large intake keeps the machine busy without running out of memory. A
+#                           summary of every image is printed and saved at the end.
+
+# Memory used by the recovery of any image (the interpreter, the hit list, and the carvers' buffers), and by each extra
+# process that scans it with --jobs
+IMAGE_BASE_MEMORY = 128 * 1024 * 1024
+SCAN_PROCESS_MEMORY = 32 * 1024 * 1024
+
+# Memory kept for each seek point of a compressed image (a copy of the decompressor and its window)
+SEEK_POINT_MEMORY = 64 * 1024
+
+# Share of the machine's memory the batch mode uses when no --memory-limit is given
+BATCH_MEMORY_SHARE = 0.5
+
+# File names that are written next to disk images by this program (or the benchmark) and are never disk images
+SIDECAR_SUFFIXES = ('.scanindex.json.gz', '.scanindex.json.gz.tmp', '.truth.json')
+
+# Known file hashes of the batch in a worker process, which each worker gets once when it starts (shared with the main
+# process when the worker is forked) instead of with every image it recovers
+batchKnownHashes = None
+
+# initBatchWorker: keeps the known file hashes of the batch in a worker process
+def initBatchWorker(knownHashes):
+    global batchKnownHashes
+    batchKnownHashes = knownHashes
+
+# findImages: returns the disk images named by the given paths, where a directory stands for every disk image in it.
+#             Only the first segment of a split raw image is kept, since it brings the rest of the segments with it
+def findImages(paths):
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = sorted(os.path.join(path, name) for name in os.listdir(path))
+            candidates = [candidate for candidate in candidates if os.path.isfile(candidate) and
+                not candidate.endswith(SIDECAR_SUFFIXES)]
+        else:
+            candidates = [path]
+        for candidate in candidates:
+            segment = re.search(r'\.(\d{3})$', candidate)
+            if segment is not None and int(segment.group(1)) > 1 and os.path.exists(candidate[:segment.start(1)] + '001'):
+                continue
+            images.append(candidate)
+    return images
+
+# imageOutputNames: returns a directory name for each disk image that is different from the names of the others (two
+#                   images with the same file name in different directories get -2, -3, ... added)
+def imageOutputNames(images):
+    names = []
+    used = set()
+    for image in images:
+        name = os.path.basename(image)
+        uniqueName = name
+        number = 2
+        while uniqueName in used:
+            uniqueName = name + '-' + str(number)
+            number = number + 1
+        used.add(uniqueName)
+        names.append(uniqueName)
+    return names
+
+# machineMemory: returns the amount of physical memory in the machine in bytes, or None if it cannot be found
+def machineMemory():
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+# estimateImageMemory: returns about how much memory recovering a disk image with the given options takes. Pages of a
+#                      memory mapped image belong to the page cache and can be dropped at any time, so only images that
+#                      are read in chunks (and the block cache and seek points of compressed images) count
+def estimateImageMemory(inputDisk, arguments):
+    compression = imageCompression(inputDisk)
+    chunked = arguments.scanMode == 'chunked' or compression is not None or len(findSegments(inputDisk)) > 1
+    jobs = 1 if compression is not None else max(1, arguments.jobs)
+    memory = IMAGE_BASE_MEMORY + max(0, arguments.hashWorkers) * COPY_BUFFER_SIZE
+    memory = memory + (jobs - 1) * SCAN_PROCESS_MEMORY
+    if chunked:
+        memory = memory + jobs * arguments.chunkSize * 1024 * 1024
+    if compression is not None:
+        # The image is at least as big as the compressed file, so this is the least the seek points can take
+        seekPoints = os.path.getsize(inputDisk) // SEEK_POINT_SPACING + 1
+        memory = memory + arguments.cacheSize * 1024 * 1024 + seekPoints * SEEK_POINT_MEMORY
+    return memory
+
+# recoverImageJob: recovers one disk image of a batch in a worker process, writing everything it prints to a log file in
+#                  the image's output directory, and returns the summary of the image (a failed image is summarized
+#                  with its error instead of stopping the batch)
+def recoverImageJob(inputDisk, outputDirectory, arguments):
+    arguments.knownHashes = batchKnownHashes
+    os.makedirs(outputDirectory, exist_ok = True)
+    manifestPath = os.path.join(outputDirectory, 'manifest.' + (arguments.manifestFormat or 'jsonl'))
+    outputPath = outputDirectory
+    if arguments.sinkType != 'dir':
+        outputPath = os.path.join(outputDirectory, 'RecoveredFiles.' + arguments.sinkType)
+    startTime = time.perf_counter()
+    with open(os.path.join(outputDirectory, 'log.txt'), 'w') as logFile, contextlib.redirect_stdout(logFile):
+        try:
+            manifest = ManifestWriter(manifestPath, arguments.manifestFormat, arguments.algorithms, arguments.filterFiles)
+            return recoverImage(inputDisk, arguments, outputPath, manifest,
+                defaultScanIndexPath(inputDisk) if arguments.useScanIndex else None, os.path.join(outputDirectory, 'profile.json'))
+        except Exception as error:
+            print('Could not recover files from ' + inputDisk + ' (' + str(error) + ')...')
+            return {'image': inputDisk, 'status': 'failed', 'error': str(error), 'output': outputPath,
+                'seconds': round(time.perf_counter() - startTime, 3)}
+
+# printBatchSummary: prints one line for each disk image of a batch and the totals over all of them
+def printBatchSummary(summaries):
+    print('\nBatch summary:')
+    for summary in summaries:
+        if summary['status'] == 'failed':
+            print('    ' + summary['image'] + ': failed (' + summary['error'] + ')')
+        else:
+            print('    ' + summary['image'] + ': ' + str(summary['files']) + ' files, ' + str(summary['bytes']) + ' bytes, ' +
+                str(summary['seconds']) + ' seconds')
+    done = [summary for summary in summaries if summary['status'] == 'done']
+    print('Total: ' + str(len(done)) + ' of ' + str(len(summaries)) + ' images recovered, ' +
+        str(sum(summary['files'] for summary in done)) + ' files, ' + str(sum(summary['bytes'] for summary in done)) + ' bytes')
+
+# recoverBatch: recovers the files from every disk image on a pool of batchJobs processes, starting each image only
+#               when the memory the running images are expected to use leaves room for it (one image is always let
+#               run), and saves the summary of every image to summary.json in the output directory. The known file
+#               hashes are handed to each process once (and counted against the memory limit once, or once for every
+#               process if they are not shared with forked processes)
+def recoverBatch(images, arguments, outputRoot, batchJobs, memoryLimit = None):
+    os.makedirs(outputRoot, exist_ok = True)
+    print('Recovering files from ' + str(len(images)) + ' disk images into ' + outputRoot + ' (' + str(batchJobs) +
+        ' at a time' + (', ' + str(memoryLimit // (1024 * 1024)) + ' MiB of memory' if memoryLimit is not None else '') + ')...')
+    # Each image gets its own directory, and their progress lines would be drawn over each other
+    arguments.showProgress = False
+    pendingImages = collections.deque(zip(images, imageOutputNames(images)))
+    summaries = {}
+    running = {}
+    knownHashes = arguments.knownHashes
+    jobArguments = argparse.Namespace(**vars(arguments))
+    jobArguments.knownHashes = None
+    memoryInUse = 0
+    if knownHashes is not None:
+        memoryInUse = knownHashes.nbytes() * (1 if multiprocessing.get_start_method() == 'fork' else batchJobs)
+    startTime = time.perf_counter()
+
+    with concurrent.futures.ProcessPoolExecutor(batchJobs, initializer = initBatchWorker, initargs = (knownHashes,)) as pool:
+        while pendingImages or running:
+            # Start images in order for as long as there are free processes and enough memory for the next one
+            while pendingImages and len(running) < batchJobs:
+                inputDisk, name = pendingImages[0]
+                try:
+                    memory = estimateImageMemory(inputDisk, arguments)
+                except OSError as error:
+                    pendingImages.popleft()
+                    summaries[inputDisk] = {'image': inputDisk, 'status': 'failed', 'error': str(error),
+                        'output': os.path.join(outputRoot, name), 'seconds': 0.0}
+                    print('Could not open ' + inputDisk + ' (' + str(error) + ')...')
+                    continue
+                if running and memoryLimit is not None and memoryInUse + memory > memoryLimit:
+                    break
+                pendingImages.popleft()
+                job = pool.submit(recoverImageJob, inputDisk, os.path.join(outputRoot, name), jobArguments)
+                running[job] = (inputDisk, memory)
+                memoryInUse = memoryInUse + memory
+
+            if not running:
+                continue
+            finishedJobs, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+            for job in finishedJobs:
+                inputDisk, memory = running.pop(job)
+                memoryInUse = memoryInUse - memory
+                summary = job.result()
+                summaries[inputDisk] = summary
+                if summary['status'] == 'failed':
+                    print('[' + str(len(summaries)) + '/' + str(len(images)) + '] ' + inputDisk + ': failed (' + summary['error'] + ')')
                 else:
-                    searchLocation = sigLocation + 12
-
-            elif sig == 'JPG':
-                # Check that the signature is at the beginning of a sector and is not just part of file contents
-                if (sigLocation % 512) == 0:
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-		    # Check for the footer that marks the end of the file
-                    eof = diskContents.find(trailers['JPG'], sigLocation)
-                    eof = eof + 3 # Add 3 to get the index of the last character of the trailer/footer (not including trailing zeros that were added)
-
-		    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.jpg'
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2)
-                    endOffset = int(math.ceil(eof / 2))
-                    fileSize = endOffset - startOffset
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ")
-                    print('End Offset: ' + str(hex(endOffset)))
-
-		    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next jpg file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = eof
-
-                # If the signature is not at the start of a sector then move the search location past it
-                else:
-                    searchLocation = sigLocation + 6
-
-            elif sig == 'DOCX':
-                # Check that the signature is at the beginning of a sector and is not just part of file contents
-                if (sigLocation % 512) == 0:
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-		    # Check for the footer that marks the end of the file
-                    eof = diskContents.find(trailers['DOCX'], sigLocation)
-                    eof = eof + 43 # Add 43 to get the index of the last character of the trailer/footer and the additional 18 bytes
-
-		    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.docx'
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2)
-                    endOffset = int(math.ceil(eof / 2))
-                    fileSize = endOffset - startOffset
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ")
-                    print('End Offset: ' + str(hex(endOffset)))
-
-		    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next docx file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = eof
-
-                # If the signature is not at the start of a sector then move the search location past it
-                else:
-                    searchLocation = sigLocation + 16
-
-            elif sig == 'AVI':
-                # Check that the signature is at the beginning of a sector and the last part of the head is present 
-                if (sigLocation % 512) == 0 and (diskContents[(sigLocation + 16):(sigLocation + 32)] == '415649204c495354'):
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-                    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.avi'
-		    # Get the file size which is the next four bytes after the signature (little endian order)
-                    fileSize = (str(diskContents[(sigLocation + 14):(sigLocation + 16)]) + str(diskContents[(sigLocation + 12):(sigLocation + 14)]) +
-                        str(diskContents[(sigLocation + 10):(sigLocation + 12)]) + str(diskContents[(sigLocation + 8):(sigLocation + 10)])) 
-                    fileSize = int(fileSize, 16) + 8 # Convert from hex to decimal and add 8 because the size given by the header is off by 8 bytes...?
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2)
-                    endOffset = startOffset + fileSize
-		    # Print file information
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ")
-                    print('End Offset: ' + str(hex(endOffset)))
-
-                    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next docx file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = sigLocation + fileSize
-
-                # If the signature is not at the start of a sector then move the search location past it
-                else:
-                    searchLocation = sigLocation + 32
-
-            elif sig == 'PNG':
-                # Check that the signature is at the beginning of a sector and is not just part of file contents
-                if (sigLocation % 512) == 0:
-                    print()
-                    # If the signature found is a header, then increment the number of files found 
-                    numFilesFound = numFilesFound + 1
-
-		    # Check for the footer that marks the end of the file
-                    eof = diskContents.find(trailers['PNG'], sigLocation)
-                    eof = eof + 15 # Add 15 to get the index of the last character of the trailer/footer 
-
-		    # Calculate file info and print it
-                    fileName = 'File' + str(numFilesFound) + '.png'
-                    # Since the disk contents are in hex we divided by 2 because 1 byte = 2 hex characters
-                    # This gives us the decimal offset that you would find on something like ActiveDiskEditor
-                    startOffset = int(sigLocation / 2)
-                    endOffset = int(math.ceil(eof / 2))
-                    fileSize = endOffset - startOffset
-                    print(fileName, end = ', ')
-                    print('Start Offset: ' + str(hex(startOffset)), end = ", ")
-                    print('End Offset: ' + str(hex(endOffset)))
-
-		    # Recover file using the file info we calculated and get SHA-256 hash
-                    recoveryCommand = 'dd if=' + str(sys.argv[1]) + ' of=' + str(fileName) + ' bs=1 skip=' + str(startOffset) + ' count=' + str(fileSize)
-                    os.system(recoveryCommand)
-                    hashCommand = 'sha256sum ' + str(fileName)
-                    print('SHA-256', end = ': ')
-                    sys.stdout.flush() # Just helps with the print statements
-                    os.system(hashCommand)
-
-                    # Move starting search location for the next docx file to the end of this file so we don't keep coming back to the current file
-                    searchLocation = eof
-
-                # If the signature is not at the start of a sector then move the search location past it
-                else:
-                    searchLocation = sigLocation + 16
+                    print('[' + str(len(summaries)) + '/' + str(len(images)) + '] ' + inputDisk + ': ' + str(summary['files']) +
+                        ' files in ' + str(summary['seconds']) + ' seconds')
+                sys.stdout.flush()
+
+    # Report the images in the order they were given
+    summaries = [summaries[inputDisk] for inputDisk in images]
+    printBatchSummary(summaries)
+    summaryPath = os.path.join(outputRoot, 'summary.json')
+    with open(summaryPath, 'w') as summaryFile:
+        json.dump({'images': summaries, 'totalSeconds': round(time.perf_counter() - startTime, 3)}, summaryFile, indent = 2)
+    print('Batch summary saved to ' + summaryPath + '...')
+    return summaries
 
-            # Try to find the next signature starting starting wherever the last signature was found so as not to get duplicates
-            sigLocation = diskContents.find(signatures[sig], searchLocation)
+# SUPPORTING METHODS
+
+# createDiskImage: opens the disk image through a memory map or for reading in chunks
+def createDiskImage(inputDisk, scanMode = 'mmap', chunkSize = CHUNK_SIZE, cacheSize = BLOCK_CACHE_SIZE):
+    source = openImageSource(inputDisk, cacheSize)
+    # Only a single raw file can be memory mapped (and an empty file cannot be, but there is nothing to map anyway),
+    # everything else is read in chunks
+    if scanMode == 'mmap' and isinstance(source, RawSource) and source.size > 0:
+        return MappedDiskImage(source, chunkSize)
+    return ChunkedDiskImage(source, chunkSize)
+
+# openDiskImage: opens the disk image so its raw bytes can be scanned either through a memory map or in chunks
+def openDiskImage(inputDisk, scanMode = 'mmap', chunkSize = CHUNK_SIZE, cacheSize = BLOCK_CACHE_SIZE):
+    print('Opening disk image...')
+
+    diskImage = createDiskImage(inputDisk, scanMode, chunkSize, cacheSize)
+    if diskImage.source.description != 'raw':
+        print('Reading the disk image as ' + diskImage.source.description + '...')
+    print('Disk image opened (' + str(diskImage.size) + ' bytes, ' + diskImage.scanMode + ' mode)...\n')
+
+    # Return the disk image
+    return diskImage
+
+# recoverFile: recovers the file described by result from the disk image into the sink, hashing it on the way, and
+#              stores its hashes in the result
+def recoverFile(diskImage, sink, result, algorithms, profile = None, fileFilter = None, ticket = None):
+    if fileFilter is not None:
+        return recoverFilteredFile(diskImage, sink, result, algorithms, profile, fileFilter, ticket)
+    startTime = time.perf_counter()
+    hasher = MultiHasher(algorithms) if algorithms else None
+    sink.extract(result['fileName'], diskImage, result['startOffset'], result['size'], hasher)
+    if hasher is not None:
+        result['digests'] = hasher.hexdigests()
+
+    # The hashes are computed while the file is copied, so take the time spent hashing out of the extract time (when
+    # only listing files without hashing them nothing is read at all)
+    if profile is not None and (hasher is not None or not isinstance(sink, NullSink)):
+        hashSeconds = hasher.seconds if hasher is not None else 0.0
+        profile.addStage('extract', time.perf_counter() - startTime - hashSeconds, result['size'])
+        if hasher is not None:
+            profile.addStage('hash', hashSeconds, result['size'])
+    return result
+
+# recoverFilteredFile: hashes the file described by result first, and only recovers it into the sink if it is not a known
+#                      file or a copy of a file that was already recovered (a copy is hard linked to that file instead if
+#                      the filter and the sink allow it). Stores its hashes and what happened to it in the result. The
+#                      ticket from fileFilter.reserve keeps the claims of files with the same contents in file order
+def recoverFilteredFile(diskImage, sink, result, algorithms, profile, fileFilter, ticket = None):
+    startTime = time.perf_counter()
+    hasher = MultiHasher(list(algorithms) + sorted(fileFilter.algorithms() - set(algorithms)))
+    try:
+        for data in readRange(diskImage, result['startOffset'], result['size']):
+            hasher.update(data)
+    except BaseException:
+        fileFilter.claim(None, result['fileName'], ticket)
+        raise
+    digests = hasher.hexdigests()
+    result['digests'] = {algorithm: digests[algorithm] for algorithm in algorithms}
+    result['duplicateOf'] = None
+    result['knownFile'] = fileFilter.isKnown(digests)
+
+    reason = None
+    if result['knownFile']:
+        reason = 'known'
+        fileFilter.claim(None, result['fileName'], ticket)
+    else:
+        storedFile = fileFilter.claim(digests, result['fileName'], ticket)
+        if storedFile is not None:
+            reason = 'duplicate'
+            storedName, storedEvent = storedFile
+            result['duplicateOf'] = storedName
+            if fileFilter.dedup == 'link':
+                storedEvent.wait()
+                result['linked'] = sink.link(result['fileName'], storedName)
+        else:
+            # The file was just read, so copying it out comes from the page cache
+            try:
+                sink.extract(result['fileName'], diskImage, result['startOffset'], result['size'])
+            finally:
+                fileFilter.stored(digests)
+
+    if profile is not None:
+        profile.addStage('extract', time.perf_counter() - startTime - hasher.seconds, result['size'])
+        profile.addStage('hash', hasher.seconds, result['size'])
+        if reason is not None:
+            profile.addFiltered(reason, result['size'])
+    return result
+
+# printResult: prints the file info and hashes of a recovered file
+def printResult(result):
+    print()
+    print(result['fileName'], end = ', ')
+    print('Start Offset: ' + str(hex(result['startOffset'])), end = ", ")
+    print('End Offset: ' + str(hex(result['endOffset'])))
+    if result.get('knownFile'):
+        print('Known file, not recovered')
+    elif result.get('duplicateOf') is not None:
+        print(('Hard linked to ' if result.get('linked') else 'Not recovered, same contents as ') + result['duplicateOf'])
+    for algorithm in result['digests']:
+        print(HASH_LABELS.get(algorithm, algorithm.upper()) + ': ' + result['digests'][algorithm] + '  ' + result['fileName'])
+
+# RecoveryQueue: recovers files into the sink in order, handing large files to a pool of threads (if the sink can write
+#                several files at once) and keeping every file in a pending queue until it can be printed (and written
+#                to the manifest) in file order
+class RecoveryQueue:
+    def __init__(self, diskImage, sink, algorithms = HASH_ALGORITHMS, hashWorkers = HASH_WORKERS, manifest = None,
+        profile = None, fileFilter = None):
+        self.diskImage = diskImage
+        self.sink = sink
+        self.algorithms = algorithms
+        self.manifest = manifest
+        self.profile = profile
+        self.fileFilter = fileFilter
+        self.hashPool = concurrent.futures.ThreadPoolExecutor(hashWorkers) if sink.concurrent and hashWorkers > 0 else None
+        self.pendingResults = collections.deque()
+
+    # submit: recovers the file described by result and gets its hashes
+    def submit(self, result):
+        ticket = self.fileFilter.reserve() if self.fileFilter is not None else None
+        if self.hashPool is not None and result['size'] >= LARGE_FILE_SIZE:
+            self.pendingResults.append(self.hashPool.submit(recoverFile, self.diskImage, self.sink, result, self.algorithms,
+                self.profile, self.fileFilter, ticket))
+        else:
+            finished = concurrent.futures.Future()
+            finished.set_result(recoverFile(self.diskImage, self.sink, result, self.algorithms, self.profile,
+                self.fileFilter, ticket))
+            self.pendingResults.append(finished)
+        self.printFinishedResults()
+
+    # printFinishedResults: prints the results at the front of the pending queue whose files have been recovered (or
+    #                       waits for all of them if wait is True)
+    def printFinishedResults(self, wait = False):
+        while self.pendingResults and (wait or self.pendingResults[0].done()):
+            result = self.pendingResults.popleft().result()
+            if self.profile is not None:
+                self.profile.clearProgress()
+            printResult(result)
+            if self.manifest is not None:
+                self.manifest.write(result)
+
+    # finish: waits for the files still being recovered
+    def finish(self):
+        self.printFinishedResults(wait = True)
+        if self.hashPool is not None:
+            self.hashPool.shutdown()
+
+# carveFooter: finds the first of the footers of the given names that follows start (and starts before limit) and returns
+#              the offset just past it, not counting the trailing zeros that were added to the footer, or -1 if there is none
+def carveFooter(hitList, start, limit, names):
+    # Without a hit list (while the footers that could belong to this file are still being scanned for) there is no footer
+    if hitList is None:
+        return -1
+    for name in names:
+        eof = hitList.findTrailer(name, start, limit)
+        if eof != -1:
+            endOffset = eof + len(trailers[name].rstrip(b'\x00'))
+            return endOffset if endOffset <= limit else -1
+    return -1
+
+# carveFile: works out where a file of type sig that starts at sigLocation ends and returns the extension, the end offset,
+#            and how the end was found ('structure' if the file was walked using its own lengths, 'header' if the size
+#            came from the header, or 'footer' if only a footer was found), or None if it is not a real file, using the
+#            carver registered for sig. Files are never allowed to be bigger than the largest size for their type
+def carveFile(diskImage, hitList, sig, sigLocation, maxSizes = MAX_FILE_SIZES):
+    carvedFile = carveStructure(diskImage, sig, sigLocation, maxSizes)
+    if carvedFile is None:
+        carvedFile = carveFooterFile(diskImage, hitList, sig, sigLocation, maxSizes)
+    return carvedFile
+
+# carveStructure: the part of carveFile that only reads the file itself (its header and its structure), which gives the
+#                 same answer however much of the disk has been scanned
+def carveStructure(diskImage, sig, sigLocation, maxSizes = MAX_FILE_SIZES):
+    limit = min(sigLocation + maxSizes[sig], diskImage.size)
+    reader = StructureReader(diskImage, sigLocation, limit)
+    carver = carvers[sig]
+
+    if carver['header'] is not None:
+        eof = carver['header'](reader, sigLocation, maxSizes[sig])
+        if eof != -1:
+            return carver['extension'], eof, 'header'
+
+    if carver['structure'] is not None:
+        eof = carver['structure'](reader, sigLocation)
+        if eof != -1:
+            return carver['extension'], eof, 'structure'
+    return None
+
+# carveFooterFile: the part of carveFile that looks for the footer of the file in the hit list (None if the type has no
+#                  footers, or the end of the file cannot be found)
+def carveFooterFile(diskImage, hitList, sig, sigLocation, maxSizes = MAX_FILE_SIZES):
+    limit = min(sigLocation + maxSizes[sig], diskImage.size)
+    carver = carvers[sig]
+    if carver['footers']:
+        eof = carveFooter(hitList, sigLocation, limit, carver['footers'])
+        if eof != -1 and eof + carver['footerExtra'] <= limit:
+            return carver['extension'], eof + carver['footerExtra'], 'footer'
+
+    # If the end of the file cannot be found or the header does not check out, the file cannot be recovered
+    return None
+
+# carveFiles: goes through the headers in offset order as the batches of hits from the scan arrive and yields a result
+#             for every file found. A header is carved as soon as its file can be walked through using its own structure,
+#             or once the scan has passed the largest size for its type so every footer that could belong to it is known.
+#             Headers that are not at the start of a sector are only counted, and the footers before every header still
+#             to be carved are dropped from the hit list (unless pruneFooters is False, for a pass that is followed by
+#             one over an earlier part of the disk)
+def carveFiles(diskImage, hitBatches, sectorSize = SECTOR_SIZE, maxSizes = MAX_FILE_SIZES, hitList = None, profile = None,
+    numFilesFound = 0, pruneFooters = True):
+    if hitList is None:
+        hitList = HitList()
+    if profile is None:
+        profile = Profile()
+    pendingHeaders = collections.deque()
+    # The header at the front of the queue that has already been walked through (and what that found), since only its
+    # footer can change as the scan goes on
+    checkedHeader = None
+    structureResult = None
+
+    # Keep track of where the search for each type of file picks up again, so the signatures inside a file that was
+    # just recovered are not mistaken for more files of that type
+    searchLocations = dict.fromkeys(signatures, 0)
+
+    # The scan runs while the next batch of hits is waited for, so that wait is the time spent scanning
+    hitBatches = iter(hitBatches)
+    while True:
+        startTime = time.perf_counter()
+        hitBatch = next(hitBatches, None)
+        if hitBatch is None:
+            break
+        hits, frontier, scannedBytes, skipped = hitBatch
+        profile.addStage('scan', time.perf_counter() - startTime, scannedBytes)
+        profile.addSkipped(skipped)
+        profile.progress(frontier, diskImage.size)
+
+        # Signatures that are not at the beginning of a sector are just part of file contents, so they are counted and
+        # never kept
+        for offset, kind, name in hits:
+            if kind == 'header':
+                profile.count(name, 'raw')
+                if offset % sectorSize != 0:
+                    profile.count(name, 'misaligned')
+        hits = [hit for hit in hits if hit[1] != 'header' or hit[0] % sectorSize == 0]
+        pendingHeaders.extend(hitList.add(hits))
+
+        # Go through all of the file signatures that were found on the disk in the order they appear
+        while pendingHeaders:
+            sigLocation, sig = pendingHeaders[0]
+            # Skip signatures inside the last recovered file of this type
+            if sigLocation < searchLocations.get(sig, 0):
+                profile.count(sig, 'insideFile')
+                pendingHeaders.popleft()
+                continue
+
+            # The header and structure are only checked once, and if they do not give the end of the file it can only come
+            # from a footer, which is looked for once the scan has passed the end of the largest file this could be
+            # (without footers for this type there is nothing to wait for)
+            startTime = time.perf_counter()
+            if checkedHeader != (sigLocation, sig):
+                checkedHeader = (sigLocation, sig)
+                structureResult = carveStructure(diskImage, sig, sigLocation, maxSizes)
+            carvedFile = structureResult
+            footersKnown = frontier >= min(sigLocation + maxSizes.get(sig, 0), diskImage.size)
+            if carvedFile is None and footersKnown:
+                carvedFile = carveFooterFile(diskImage, hitList, sig, sigLocation, maxSizes)
+            carveSeconds = time.perf_counter() - startTime
+            profile.signatures[sig]['carveSeconds'] = profile.signatures[sig]['carveSeconds'] + carveSeconds
+            profile.addStage('carve', carveSeconds)
+            if carvedFile is None and not footersKnown and carvers[sig]['footers']:
+                break # Wait for the next batch of hits
+            pendingHeaders.popleft()
+            profile.count(sig, 'rejected' if carvedFile is None else 'accepted')
+
+            if carvedFile is not None:
+                extension, endOffset, status = carvedFile
+                # If the signature found is a header, then increment the number of files found
+                numFilesFound = numFilesFound + 1
+
+                # A size taken from a damaged header can point past the end of the disk, so only recover what is actually there
+                yield {'fileName': 'File' + str(numFilesFound) + '.' + extension, 'type': sig, 'startOffset': sigLocation,
+                    'endOffset': endOffset, 'size': max(0, min(endOffset, diskImage.size) - sigLocation), 'status': status,
+                    'digests': {}}
+
+                # Move starting search location for the next file of this type to the end of this file so we don't keep coming back to the current file
+                searchLocations[sig] = endOffset
+
+        # Every header still to come in this pass starts after the frontier, so the footers before the first header
+        # that is still waiting can no longer belong to anything
+        if pruneFooters:
+            hitList.prune(pendingHeaders[0][0] if pendingHeaders else frontier)
+
+# recoverResult: recovers a file that was found and gets its hashes. Files of the types that were not asked for keep
+#                their number (and any hashes from an earlier run), but are not recovered
+def recoverResult(recoveryQueue, result, types = None, cachedDigests = {}):
+    if types is not None and result['type'] not in types:
+        result['digests'] = cachedDigests.get((result['type'], result['startOffset'], result['endOffset']), {})
+        return
+    recoveryQueue.submit(result)
+
+# planScan: works out which (start, end) regions of the disk are scanned in each pass and returns them along with the
+#           holes that are skipped and the volumes that were found. The holes of a sparse disk image are left out (apart
+#           from a little before the data after each one, where a pattern that starts with zeros can begin), since they
+#           can only hold zeros. With unallocated the first pass is only the space the file systems are not using, and
+#           with 'first' a second pass covers the rest of the disk
+def planScan(diskImage, sectorSize = SECTOR_SIZE, unallocated = None, profile = None):
+    if profile is None:
+        profile = Profile()
+    with profile.stage('holes'):
+        dataExtents = mergeExtents([(start - SKIP_MARGIN, end) for start, end in diskImage.dataExtents()], diskImage.size)
+    holes = invertExtents(dataExtents, diskImage.size)
+    profile.addSkipped([(start, end, 'hole') for start, end in holes])
+
+    if unallocated is None:
+        return [dataExtents], holes, []
+    with profile.stage('filesystems'):
+        extents, volumes = findUnallocatedExtents(diskImage)
+    scanPasses = [extents]
+    if unallocated == 'first':
+        scanPasses.append(invertExtents(extents, diskImage.size))
+    return [intersectExtents(regions, dataExtents) for regions in scanPasses], holes, volumes
+
+# locateAndRecoverFiles: scans the disk image for every signature and footer, and recovers the files they belong to in
+#                        offset order while the scan goes on (with a NullSink it only lists them)
+def locateAndRecoverFiles(diskImage, sink, sectorSize = SECTOR_SIZE, sectorIndex = False, algorithms = HASH_ALGORITHMS,
+    hashWorkers = HASH_WORKERS, jobs = 1, maxSizes = MAX_FILE_SIZES, indexPath = None, types = None, manifest = None,
+    profile = None, unallocated = None, fileFilter = None):
+    print('Begin looking for file signatures (this process can take a minute or two)...')
+    # Initialize the list of recovered files
+    results = []
+    if profile is None:
+        profile = Profile()
+    recoveryQueue = RecoveryQueue(diskImage, sink, algorithms, hashWorkers, manifest, profile, fileFilter)
+
+    # Find every header and footer on the disk in one pass
+    # (or load them from the scan index if there is one and only scan what changed)
+    hitList = HitList(keepHits = indexPath is not None)
+    cachedDigests = {}
+    scanPasses, holes, volumes = planScan(diskImage, sectorSize, unallocated, profile)
+    if holes:
+        print('Skipping ' + str(sum(end - start for start, end in holes)) + ' bytes in ' + str(len(holes)) +
+            ' holes of the sparse disk image...')
+
+    if unallocated is not None:
+        if not volumes:
+            print('No partition table or file system found, the whole disk image is unallocated...')
+        for start, name, size, unallocatedSize in volumes:
+            print('Found ' + name + ' volume at ' + str(hex(start)) + ' (' + str(unallocatedSize) + ' of ' + str(size) +
+                ' bytes unallocated)...')
+        print('Scanning ' + str(sum(end - start for start, end in scanPasses[0])) + ' unallocated bytes' +
+            (' first...' if unallocated == 'first' else '...'))
+        hitBatches = [streamHits(diskImage, sectorSize if sectorIndex else None, jobs, regions) for regions in scanPasses]
+    elif indexPath is not None:
+        hitBatches, scanIndex = cachedHitBatches(diskImage, indexPath, sectorSize if sectorIndex else None, jobs,
+            scanPasses[0])
+        cachedDigests = {(cachedFile['type'], cachedFile['startOffset'], cachedFile['endOffset']): cachedFile['digests']
+            for cachedFile in scanIndex['files']}
+        hitBatches = [hitBatches]
+    else:
+        hitBatches = [streamHits(diskImage, sectorSize if sectorIndex else None, jobs, regions) for regions in scanPasses]
+
+    for passNumber, scanPass in enumerate(hitBatches):
+        for result in carveFiles(diskImage, scanPass, sectorSize, maxSizes, hitList, profile, len(results),
+            passNumber == len(hitBatches) - 1):
+            results.append(result)
+            recoverResult(recoveryQueue, result, types, cachedDigests)
+
+    # Wait for the files still being recovered
+    profile.clearProgress()
+    recoveryQueue.finish()
+
+    # Save the hits and files so the next run on this disk image can skip the scan
+    if indexPath is not None:
+        scanIndex['hits'] = hitList.hits
+        # Files that were not hashed this time (with --list-only, --hashes '', or --types) keep the hashes from earlier runs
+        scanIndex['files'] = [dict(result, digests = dict(cachedDigests.get((result['type'], result['startOffset'],
+            result['endOffset']), {}), **result['digests'])) for result in results]
+        if saveScanIndex(indexPath, scanIndex):
+            print('Scan index saved to ' + indexPath + '...')
 
     print('Done locating file signatures...\n')
-    print('Total number of files found: ' + str(numFilesFound))
+    print('Total number of files found: ' + str(len(results)))
+    return results
+
+# recoverFromManifest: recovers only the files listed in a manifest (for example one made with --list-only and then
+#                      filtered), without scanning the disk image
+def recoverFromManifest(diskImage, sink, manifestPath, algorithms = HASH_ALGORITHMS, hashWorkers = HASH_WORKERS,
+    manifest = None, profile = None, fileFilter = None):
+    print('Recovering the files listed in ' + manifestPath + '...')
+    results = readManifest(manifestPath)
+    recoveryQueue = RecoveryQueue(diskImage, sink, algorithms, hashWorkers, manifest, profile, fileFilter)
+    for result in results:
+        recoveryQueue.submit(result)
+    recoveryQueue.finish()
+
+    print('Done recovering files...\n')
+    print('Total number of files recovered: ' + str(len(results)))
+    return results
+
+# recoverImage: opens a disk image, recovers its files into outputPath (or only lists them) with the options from the
+#               command line, writes them to the manifest (which it closes), prints and saves what was measured, and
+#               returns a summary of what was found
+def recoverImage(inputDisk, arguments, outputPath = None, manifest = None, indexPath = None, profilePath = None):
+    profile = Profile(arguments.showProgress)
+
+    # Open the disk so its contents can be scanned
+    with profile.stage('open'):
+        diskImage = openDiskImage(inputDisk, arguments.scanMode, arguments.chunkSize * 1024 * 1024,
+            arguments.cacheSize * 1024 * 1024)
+
+    # Worker processes open the disk image again, which would mean decompressing all of a compressed image again
+    jobs = arguments.jobs
+    if jobs > 1 and not diskImage.source.reopenable:
+        print('A ' + diskImage.source.description + ' image is scanned by one process, ignoring --jobs...\n')
+        jobs = 1
+
+    # With the disk open, locate the file signatures and recover the files (or only list them), leaving out duplicates
+    # and known files if asked to
+    sink = NullSink() if arguments.listOnly else openSink(arguments.sinkType, outputPath)
+    fileFilter = None
+    if arguments.dedup is not None or arguments.knownHashes is not None:
+        fileFilter = FileFilter(arguments.dedup, arguments.knownHashes)
+    if arguments.extractManifest is not None:
+        results = recoverFromManifest(diskImage, sink, arguments.extractManifest, arguments.algorithms,
+            arguments.hashWorkers, manifest, profile, fileFilter)
+    else:
+        results = locateAndRecoverFiles(diskImage, sink, arguments.sectorSize, arguments.sectorIndex, arguments.algorithms,
+            arguments.hashWorkers, jobs, arguments.maxSizes, indexPath, arguments.types, manifest, profile,
+            arguments.unallocated, fileFilter)
+    sink.close()
+    if manifest is not None:
+        manifest.close()
+
+    # Show what was measured, and save it if asked to
+    printProfile(profile)
+    if profilePath is not None:
+        saveProfile(profilePath, profile, diskImage)
+    diskImage.close()
+    print('Disk image closed...')
+
+    types = {}
+    for result in results:
+        types[result['type']] = types.get(result['type'], 0) + 1
+    return {'image': inputDisk, 'status': 'done', 'output': outputPath, 'files': len(results),
+        'bytes': sum(result['size'] for result in results), 'types': types,
+        'seconds': round(time.perf_counter() - profile.startTime, 3), 'filtered': profile.filtered,
+        'skippedBytes': profile.skippedBytes()}
+
+# parseArguments: reads the disk image and the scanning options from the command line
+def parseArguments():
+    parser = argparse.ArgumentParser(description = 'Locates file signatures in a disk image and recovers the files')
+    parser.add_argument('inputDisks', nargs = '+', metavar = 'inputDisk',
+        help = 'path to the disk image (several images or a directory of them are recovered in batch mode)')
+    parser.add_argument('--scan-mode', dest = 'scanMode', choices = ['mmap', 'chunked'], default = 'mmap',
+        help = 'memory map the image (default) or read it in fixed-size chunks')
+    parser.add_argument('--chunk-size', dest = 'chunkSize', type = int, default = CHUNK_SIZE // (1024 * 1024),
+        help = 'chunk size in MiB for the chunked scan mode (default: %(default)s)')
+    parser.add_argument('--cache-size', dest = 'cacheSize', type = int, default = BLOCK_CACHE_SIZE // (1024 * 1024),
+        help = 'MiB of decompressed blocks to keep in memory when reading a compressed image (default: %(default)s)')
+    parser.add_argument('--sector-size', dest = 'sectorSize', type = int, choices = [512, 4096], default = SECTOR_SIZE,
+        help = 'size of the sectors that files start on (default: %(default)s)')
+    parser.add_argument('--sector-index', dest = 'sectorIndex', action = 'store_true',
+        help = 'find headers by only checking the start of every sector instead of searching every byte')
+    parser.add_argument('--sink', dest = 'sinkType', choices = ['dir', 'tar', 'zip'], default = 'dir',
+        help = 'write the recovered files into a directory (default), a tar file, or a zip file')
+    parser.add_argument('--output', dest = 'outputPath', default = None,
+        help = 'output directory or archive path (default: current directory, RecoveredFiles.tar, or RecoveredFiles.zip)')
+    parser.add_argument('--hashes', dest = 'algorithms', default = None,
+        help = 'comma separated hashes to compute for each file, or an empty string for none (default: ' +
+        ','.join(HASH_ALGORITHMS) + ', or none with --list-only)')
+    parser.add_argument('--hash-workers', dest = 'hashWorkers', type = int, default = HASH_WORKERS,
+        help = 'threads used to recover and hash large files, 0 to do everything on the main thread (default: %(default)s)')
+    parser.add_argument('--jobs', dest = 'jobs', type = int, default = 1,
+        help = 'number of processes that scan regions of the disk image in parallel (default: %(default)s)')
+    parser.add_argument('--max-size', dest = 'maxSizes', action = 'append', default = [], metavar = 'TYPE=MIB',
+        help = 'largest file of a type to carve in MiB, for example JPG=16 (can be given more than once)')
+    parser.add_argument('--types', dest = 'types', default = None,
+        help = 'comma separated types of file to recover (the rest are still numbered but not recovered)')
+    parser.add_argument('--scan-index', dest = 'indexPath', default = None,
+        help = 'where to keep the scan index of the disk image (default: next to the image)')
+    parser.add_argument('--no-scan-index', dest = 'useScanIndex', action = 'store_false',
+        help = 'always scan the whole disk image and do not save a scan index')
+    parser.add_argument('--unallocated', dest = 'unallocated', choices = ['only', 'first'], default = None,
+        help = 'read the partition table and FAT/NTFS allocation maps, and carve only the unallocated space or carve it ' +
+        'before the rest of the disk (the scan index is not used)')
+    parser.add_argument('--list-only', dest = 'listOnly', action = 'store_true',
+        help = 'only list the files on the disk image in the manifest, without recovering them')
+    parser.add_argument('--extract', dest = 'extractManifest', default = None, metavar = 'MANIFEST',
+        help = 'recover only the files listed in a manifest instead of scanning the disk image')
+    parser.add_argument('--manifest', dest = 'manifestPath', default = None,
+        help = 'write a record for each file to this JSON lines or CSV file, or - for standard output ' +
+        '(default: - with --list-only, none otherwise)')
+    parser.add_argument('--manifest-format', dest = 'manifestFormat', choices = ['jsonl', 'csv'], default = None,
+        help = 'format of the manifest (default: csv if the manifest file name ends in .csv, jsonl otherwise)')
+    parser.add_argument('--profile', dest = 'profilePath', default = None,
+        help = 'write the time and bytes of each stage and the counts for each type of header to this JSON file')
+    parser.add_argument('--progress', dest = 'showProgress', action = argparse.BooleanOptionalAction, default = None,
+        help = 'show a live progress line while scanning (default: only when standard error is a terminal)')
+    parser.add_argument('--dedup', dest = 'dedup', choices = ['once', 'link'], default = None,
+        help = 'write files with the same contents only once (the copies are only recorded), or hard link the copies ' +
+        'to the file that was written (dir and tar sinks)')
+    parser.add_argument('--known-hashes', dest = 'knownHashPaths', action = 'append', default = [], metavar = 'HASHLIST',
+        help = 'file of MD5, SHA-1, or SHA-256 hashes of known files (like the NSRL) that are not recovered ' +
+        '(can be given more than once)')
+    parser.add_argument('--batch-jobs', dest = 'batchJobs', type = int, default = None,
+        help = 'number of disk images recovered at once in batch mode (default: the number of CPUs divided by --jobs)')
+    parser.add_argument('--memory-limit', dest = 'memoryLimit', type = int, default = None,
+        help = 'MiB of memory the disk images recovered at once in batch mode can use between them (default: ' +
+        str(int(BATCH_MEMORY_SHARE * 100)) + '%% of the machine\'s memory)')
+    arguments = parser.parse_args()
+
+    # More than one disk image (or a directory of them) is recovered in batch mode, with everything for each image kept
+    # in its own directory under --output
+    arguments.batch = len(arguments.inputDisks) > 1 or os.path.isdir(arguments.inputDisks[0])
+    arguments.inputDisk = arguments.inputDisks[0]
+    if arguments.batch:
+        for option, value in [('--scan-index', arguments.indexPath), ('--extract', arguments.extractManifest),
+            ('--manifest', arguments.manifestPath), ('--profile', arguments.profilePath)]:
+            if value is not None:
+                parser.error(option + ' cannot be used with several disk images (each image gets its own manifest and ' +
+                    'profile in its output directory)')
+        if arguments.batchJobs is None:
+            arguments.batchJobs = max(1, (os.cpu_count() or 1) // max(1, arguments.jobs))
+        if arguments.batchJobs < 1:
+            parser.error('--batch-jobs must be at least 1')
+        if arguments.memoryLimit is not None:
+            arguments.memoryLimit = arguments.memoryLimit * 1024 * 1024
+        elif machineMemory() is not None:
+            arguments.memoryLimit = int(machineMemory() * BATCH_MEMORY_SHARE)
+        if arguments.outputPath is None:
+            arguments.outputPath = 'RecoveredImages'
+
+    if arguments.chunkSize < 1:
+        parser.error('--chunk-size must be at least 1')
+    if arguments.showProgress is None:
+        arguments.showProgress = sys.stderr.isatty()
+    if arguments.listOnly and arguments.extractManifest is not None:
+        parser.error('--list-only and --extract cannot be used together')
+    if arguments.algorithms is None:
+        arguments.algorithms = '' if arguments.listOnly else ','.join(HASH_ALGORITHMS)
+    arguments.algorithms = [algorithm for algorithm in arguments.algorithms.split(',') if algorithm]
+    # The SHAKE hashes have no fixed length, so they cannot be printed like the others
+    hashAlgorithms = sorted(algorithm for algorithm in hashlib.algorithms_available if not algorithm.startswith('shake'))
+    for algorithm in arguments.algorithms:
+        if algorithm not in hashAlgorithms:
+            parser.error('--hashes must be a comma separated list of ' + ', '.join(hashAlgorithms))
+    arguments.filterFiles = arguments.dedup is not None or bool(arguments.knownHashPaths)
+    arguments.knownHashes = None
+    if arguments.listOnly and arguments.manifestPath is None and not arguments.batch:
+        arguments.manifestPath = '-'
+
+    if arguments.types is not None:
+        arguments.types = arguments.types.split(',')
+        for sig in arguments.types:
+            if sig not in signatures:
+                parser.error('--types must be a comma separated list of ' + ', '.join(signatures))
+    # A scan of part of the disk would leave the scan index without the hits from the rest of it
+    if arguments.unallocated is not None:
+        arguments.useScanIndex = False
+    if arguments.useScanIndex and arguments.indexPath is None and not arguments.batch:
+        arguments.indexPath = defaultScanIndexPath(arguments.inputDisk)
+    elif not arguments.useScanIndex:
+        arguments.indexPath = None
+
+    # Turn the TYPE=MiB size limits into a full dictionary of limits in bytes
+    maxSizes = dict(MAX_FILE_SIZES)
+    for maxSize in arguments.maxSizes:
+        sig, _, size = maxSize.partition('=')
+        if sig not in maxSizes or not size.isdigit():
+            parser.error('--max-size must look like TYPE=MiB where TYPE is one of ' + ', '.join(maxSizes))
+        maxSizes[sig] = int(size) * 1024 * 1024
+    arguments.maxSizes = maxSizes
+    return arguments
 
 # MAIN METHOD
 def main():
-    print('=================== STARTING AUTOMATED FILE RECOVERY PROGRAM ===================')
-    # Get the disk image from the command line arguements
-    inputDisk = sys.argv[1]
-
-    # Open the disk and get its contents
-    diskContents = openDiskImage(inputDisk)
+    # Get the disk image and options from the command line arguements
+    arguments = parseArguments()
+
+    if arguments.batch:
+        print('=================== STARTING AUTOMATED FILE RECOVERY PROGRAM ===================')
+        if arguments.knownHashPaths:
+            arguments.knownHashes = loadKnownHashes(arguments.knownHashPaths)
+        images = findImages(arguments.inputDisks)
+        if not images:
+            print('No disk images found...')
+            return
+        recoverBatch(images, arguments, arguments.outputPath, arguments.batchJobs, arguments.memoryLimit)
+        return
+
+    # When the manifest goes to standard output, everything else is printed to standard error instead
+    manifest = None
+    if arguments.manifestPath is not None:
+        manifest = ManifestWriter(arguments.manifestPath, arguments.manifestFormat, arguments.algorithms, arguments.filterFiles)
+    with contextlib.redirect_stdout(sys.stderr if arguments.manifestPath == '-' else sys.stdout):
+        print('=================== STARTING AUTOMATED FILE RECOVERY PROGRAM ===================')
+        if arguments.knownHashPaths:
+            arguments.knownHashes = loadKnownHashes(arguments.knownHashPaths)
+        recoverImage(arguments.inputDisk, arguments, arguments.outputPath, manifest, arguments.indexPath,
+            arguments.profilePath)
 
-    # With the disk contents, locate the file signatures and recover the files
-    locateAndRecoverFiles(diskContents)
-    
 if __name__ == "__main__":
     main()